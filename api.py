@@ -3,15 +3,38 @@ This module defines a FastAPI application for handling queries, retrieving sourc
 and generating AI-powered responses and multiple-choice questions (QCM).
 """
 
+import json
 import time
 import logging
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from tools.agents import compute_embedding, generate_ai_response, create_mcq
-from tools.retrieve import find_best_match
-from tools.utils import get_random_qcm
-from database_init.database import connect_db
-from tools.config import TABLE_NAME
+import threading
+import contextvars
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+# Modules from tools/ and database_init/ import each other by flat module name;
+# import them the same way so that each is loaded once per process (one
+# embedding model, one LLM gateway, one metrics registry)
+from agents import (
+    compute_embedding, compute_embeddings, generate_ai_response, create_mcq)
+from retrieve import (
+    find_top_matches, find_top_matches_batch, get_bert_scorer, get_corpus_index,
+    TOP_K, MAX_TOP_K)
+from utils import get_random_qcm
+from singleflight import SingleFlight
+from database import connect_db
+from config import TABLE_NAME
+from telemetry import (
+    PROMETHEUS_ENABLED, in_flight, merge_timings, metrics_payload,
+    record_request, server_timing_header, start_request)
+from profiling import (
+    get_profile_path, is_authorized, profiled, should_profile, start_profile)
+from gateway import CircuitOpenError, LLMUnavailableError
+from cache import LRUCache
+from config import (
+    LLM_BREAKER_RESET, ANSWER_BUDGET_SECONDS, ANSWER_CACHE_SIZE, RETRIEVAL_SHARDS)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +42,121 @@ logging.basicConfig(level=logging.INFO)
 # Initialize FastAPI
 app = FastAPI()
 
+# Batch processing: questions embedded per chunk, LLM calls fanned out on a pool
+BATCH_CHUNK_SIZE = 32
+LLM_CONCURRENCY = 8
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY)
+
+# Identical /answer requests in flight share one computation
+answer_flight = SingleFlight("answer")
+
+# Latency budget: generation runs on its own pool so /answer can stop waiting,
+# and completed generations are cached to serve as the next fallback. Queued
+# plus running generations are capped so a stalled provider cannot pile up work.
+GENERATION_BACKLOG = 4 * LLM_CONCURRENCY
+generation_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY)
+generation_slots = threading.BoundedSemaphore(GENERATION_BACKLOG)
+answer_cache = LRUCache("answer", ANSWER_CACHE_SIZE)
+NO_ANSWER = "No answer could be generated in time. Please try again later."
+
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(_request: Request, error: LLMUnavailableError):
+    """Reports a saturated or degraded LLM provider as a retryable 503."""
+    retry_after = LLM_BREAKER_RESET if isinstance(error, CircuitOpenError) else 1
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(error)},
+        headers={"Retry-After": str(int(retry_after))})
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Times every request and reports its per-stage durations.
+
+    The request is measured until its body has been fully sent, so streamed
+    (NDJSON) responses are timed to their last line. Server-Timing is only
+    set on responses whose body was complete when the headers went out."""
+    timings = start_request()
+    start_time = time.perf_counter()
+    stack = ExitStack()
+    stack.enter_context(in_flight("requests"))
+    try:
+        response = await call_next(request)
+    except BaseException:
+        stack.close()
+        raise
+
+    if "content-length" in response.headers:
+        timings["total"] = time.perf_counter() - start_time
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+    route = request.scope.get("route")
+    endpoint = route.path if route else "unmatched"
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            stack.close()
+            record_request(
+                endpoint, response.status_code, time.perf_counter() - start_time)
+
+    response.body_iterator = timed_body()
+    return response
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profiles the request when authorized or sampled."""
+    token = (request.headers.get("X-Profile-Token")
+             or request.query_params.get("profile"))
+    if not should_profile(token):
+        return await call_next(request)
+
+    request_id = start_profile()
+    response = await call_next(request)
+    # Only @profiled endpoints write an artifact; don't hand out ids that 404
+    if get_profile_path(request_id):
+        response.headers["X-Profile-Id"] = request_id
+    return response
+
+
+@app.get("/profiles/{request_id}", include_in_schema=False)
+def get_profile(
+        request_id: str,
+        token: str = Header(None, alias="X-Profile-Token")):
+    """Returns the profile artifact recorded for a request."""
+    if not is_authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token.")
+    path = get_profile_path(request_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=path.rsplit("/", 1)[-1])
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Exports the Prometheus metrics."""
+    if not PROMETHEUS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
+
+def warm_up():
+    """Loads the corpus index and the BERTScore model ahead of the first request.
+
+    Called by the gunicorn master before forking (see gunicorn.conf.py) so that
+    workers share these pages copy-on-write instead of loading their own copy.
+    Retrieval shards talk to their coordinator over pipes that cannot be
+    shared across fork, so in sharded mode each worker builds its own index."""
+    if RETRIEVAL_SHARDS <= 1:
+        get_corpus_index()
+    get_bert_scorer()
+
 # Model for API requests
 
 
@@ -27,37 +165,133 @@ class QueryRequest(BaseModel):
     question: str
     temperature: float = 0.7
     language: str = "english"
+    top_k: int = Field(TOP_K, ge=1, le=MAX_TOP_K)
+    # Seconds to wait for the LLM before falling back (None: server default, 0: no limit)
+    budget: Optional[float] = Field(None, ge=0)
+
+
+class BatchQueryRequest(BaseModel):
+    """Model for handling a batch of user queries."""
+    questions: List[str]
+    temperature: float = 0.7
+    language: str = "english"
+    top_k: int = Field(TOP_K, ge=1, le=MAX_TOP_K)
 
 # Endpoint to get sources
 
 
 @app.post("/get_sources")
+@profiled
 def get_sources(request: QueryRequest):
     """Finds the best matching source for a given query."""
     start_time = time.time()
     query_embedding = compute_embedding(request.question)
-    best_match = find_best_match(request.question, query_embedding)
+    matches = find_top_matches(
+        request.question, query_embedding, request.top_k)
 
     response_time = round(time.time() - start_time, 4)
     logging.info("Response time for get_sources: %s seconds", response_time)
 
-    if best_match:
-        return best_match
+    if matches:
+        return {**matches[0], "candidates": matches}
     raise HTTPException(status_code=404, detail="No relevant document found.")
 
 # Endpoint to generate an enriched answer with Gemini
 
 
-@app.post("/answer")
-def answer(request: QueryRequest):
-    """Generates an AI response based on the best match or AI-generated content."""
-    start_time = time.time()
-    query_embedding = compute_embedding(request.question)
-    best_match = find_best_match(request.question, query_embedding)
+def question_key(question: str, language: str, temperature: float, top_k: int) -> tuple:
+    """Key under which identical questions share their computation and cached answer."""
+    return (
+        " ".join(question.lower().split()),
+        language.strip().lower(),
+        temperature,
+        top_k,
+    )
+
+
+def generate_and_cache(
+        cache_key: tuple,
+        question: str,
+        documents,
+        language: str) -> str:
+    """Generates the enriched answer and keeps it as a fallback for later requests."""
+    response = generate_ai_response(question, documents, language)
+    answer_cache.put(cache_key, response)
+    return response
 
-    if not best_match or not best_match.get("answer"):
-        llm_response = generate_ai_response(
-            request.question, "AI generation", request.language)
+
+def generate_detached(timings: dict, *args) -> str:
+    """Runs a generation recording its stages into its own timings dict.
+
+    The generation may outlive the request, so it must not write into the
+    request's timings while the middleware serializes them."""
+    start_request(timings)
+    return generate_and_cache(*args)
+
+
+def submit_generation(timings: dict, *args):
+    """Queues a generation, or returns None when the backlog is full."""
+    if not generation_slots.acquire(blocking=False):
+        return None
+    future = generation_executor.submit(
+        contextvars.Context().run, generate_detached, timings, *args)
+    future.add_done_callback(lambda _: generation_slots.release())
+    return future
+
+
+def generate_within_budget(
+        cache_key: tuple,
+        question: str,
+        matches: List[dict],
+        language: str,
+        budget: float) -> tuple:
+    """Returns the answer and its origin: "llm", "cache", "retrieval" or "none".
+
+    When the LLM fails or misses the budget, the caller gets the last cached
+    answer or, failing that, the retrieved MedQuAD answer verbatim (a fixed
+    "no answer" message for off-corpus questions). A generation that already
+    started keeps running and fills the cache; one still queued is cancelled."""
+    documents = matches or "AI generation"
+    if not budget:
+        return generate_and_cache(cache_key, question, documents, language), "llm"
+
+    generation_timings = {}
+    future = submit_generation(
+        generation_timings, cache_key, question, documents, language)
+    if future is None:
+        logging.warning("LLM generation backlog is full, falling back.")
+    else:
+        try:
+            response = future.result(timeout=budget)
+            merge_timings(generation_timings)
+            return response, "llm"
+        except FutureTimeoutError:
+            future.cancel()
+            logging.warning(
+                "No LLM answer within the %ss budget, falling back.", budget)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.warning("LLM generation failed (%s), falling back.",
+                            type(e).__name__)
+
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        return cached, "cache"
+    if matches:
+        return matches[0]["answer"], "retrieval"
+    return NO_ANSWER, "none"
+
+
+def build_answer(
+        question: str,
+        matches: List[dict],
+        language: str,
+        start_time: float,
+        cache_key: tuple,
+        budget: float = 0) -> dict:
+    """Generates the enriched answer payload for a question and its retrieved matches."""
+    if not matches:
+        llm_response, origin = generate_within_budget(
+            cache_key, question, matches, language, budget)
         response_time = round(time.time() - start_time, 4)
         logging.info(
             "Response time for answer (no match found): %s seconds",
@@ -65,18 +299,20 @@ def answer(request: QueryRequest):
 
         return {
             "answer": llm_response,
-            "source": "Generated by AI",
+            "source": "Generated by AI" if origin != "none" else None,
             "focus_area": "General Knowledge",
             "similarity": None,
             "metrics": {},
+            "documents": [],
+            "enriched": origin != "none",
+            "answer_origin": origin,
             "response_time": response_time
         }
 
-    response = generate_ai_response(
-        request.question,
-        best_match["answer"],
-        request.language)
-    metrics = {
+    best_match = matches[0]
+    response, origin = generate_within_budget(
+        cache_key, question, matches, language, budget)
+    match_metrics = {
         "cosine_similarity": best_match["cosine_similarity"],
         "jaccard_similarity": best_match["jaccard_similarity"],
         "meteor_score": best_match["meteor_score"],
@@ -87,19 +323,117 @@ def answer(request: QueryRequest):
     logging.info(
         "Response time for answer (with match found): %s seconds",
         response_time)
-    logging.info("Metrics: %s", metrics)
+    logging.info("Metrics: %s", match_metrics)
 
     return {
         "answer": response,
         "source": best_match["source"],
         "focus_area": best_match["focus_area"],
         "similarity": best_match["cosine_similarity"],
-        "metrics": metrics,
+        "metrics": match_metrics,
+        "documents": [
+            {
+                "source": match["source"],
+                "focus_area": match["focus_area"],
+                "similarity": match["cosine_similarity"],
+                "rerank_score": match["rerank_score"],
+            }
+            for match in matches
+        ],
+        "enriched": origin != "retrieval",
+        "answer_origin": origin,
         "response_time": response_time
     }
 
 
+def answer_budget(request: QueryRequest) -> float:
+    """Latency budget of a request, defaulting to the server-wide one."""
+    return ANSWER_BUDGET_SECONDS if request.budget is None else request.budget
+
+
+def compute_answer(request: QueryRequest) -> dict:
+    """Retrieves the matches for a question and generates its answer."""
+    start_time = time.time()
+    query_embedding = compute_embedding(request.question)
+    matches = find_top_matches(
+        request.question, query_embedding, request.top_k)
+    cache_key = question_key(
+        request.question, request.language, request.temperature, request.top_k)
+    return build_answer(
+        request.question, matches, request.language, start_time,
+        cache_key, answer_budget(request))
+
+
+@app.post("/answer")
+@profiled
+def answer(request: QueryRequest):
+    """Generates an AI response based on the best match or AI-generated content."""
+    key = (*question_key(request.question, request.language,
+                         request.temperature, request.top_k),
+           answer_budget(request))
+    return answer_flight.do(key, compute_answer, request)
+
+# Batch endpoints, streamed as NDJSON (one JSON object per line, in input order)
+
+
+def iter_batch_matches(request: BatchQueryRequest):
+    """Embeds and retrieves the questions chunk by chunk to bound memory usage."""
+    for offset in range(0, len(request.questions), BATCH_CHUNK_SIZE):
+        chunk = request.questions[offset:offset + BATCH_CHUNK_SIZE]
+        query_embeddings = compute_embeddings(chunk)
+        yield chunk, find_top_matches_batch(chunk, query_embeddings, request.top_k)
+
+
+def to_ndjson(records):
+    """Serializes an iterable of records as newline-delimited JSON."""
+    for record in records:
+        yield json.dumps(record, default=float) + "\n"
+
+
+@app.post("/get_sources/batch")
+def get_sources_batch(request: BatchQueryRequest):
+    """Finds the best matching sources for many queries in one encoder batch."""
+    def records():
+        for chunk, chunk_matches in iter_batch_matches(request):
+            for question, matches in zip(chunk, chunk_matches):
+                if matches:
+                    yield {"question": question, **matches[0], "candidates": matches}
+                else:
+                    yield {"question": question,
+                           "detail": "No relevant document found."}
+
+    return StreamingResponse(
+        to_ndjson(records()), media_type="application/x-ndjson")
+
+
+@app.post("/answer/batch")
+def answer_batch(request: BatchQueryRequest):
+    """Generates AI responses for many queries, fanning LLM calls out concurrently."""
+    def records():
+        for chunk, chunk_matches in iter_batch_matches(request):
+            start_time = time.time()
+            futures = [
+                llm_executor.submit(
+                    build_answer, question, matches, request.language, start_time,
+                    question_key(question, request.language,
+                                 request.temperature, request.top_k))
+                for question, matches in zip(chunk, chunk_matches)
+            ]
+            for question, future in zip(chunk, futures):
+                # Headers are already sent: report the failure in the item itself
+                try:
+                    yield {"question": question, **future.result()}
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.error("Batch answer failed for %r: %s", question, e)
+                    yield {"question": question,
+                           "error": f"{type(e).__name__}: {e}"}
+
+    return StreamingResponse(
+        to_ndjson(records()), media_type="application/x-ndjson")
+
+
 @app.get("/qcm/themes")
+@profiled
 def get_themes():
     """Returns a list of available QCM themes."""
     conn = connect_db()
@@ -112,6 +446,7 @@ def get_themes():
 
 
 @app.get("/qcm")
+@profiled
 def get_qcm(n: int = 5, focus_area: str = None):
     """Returns a set of dynamically generated multiple-choice questions filtered by theme."""
     questions = get_random_qcm(n, focus_area)
@@ -5,21 +5,99 @@ and user feedback collection.
 """
 
 import os
+import json
 from io import BytesIO
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
 import pyttsx3
 import streamlit as st
 import speech_recognition as sr
 import matplotlib.pyplot as plt
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from tools.utils import is_feedback_file_empty
+from tools.feedback_store import FeedbackStore
 
 # ---------------- CONFIGURATION ----------------
 API_ANSWER_URL = "http://127.0.0.1:8000/answer"
 API_QCM_URL = "http://127.0.0.1:8000/qcm"
 GENERAL_FEEDBACK_FILE = "eval/feedback.csv"
+THEMES_CACHE_TTL = 600  # secondes
+QCM_CACHE_TTL = 60  # secondes
+
+
+# ---------------- CACHES ----------------
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Returns an HTTP session pooled across reruns and users."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+@st.cache_data(ttl=THEMES_CACHE_TTL, show_spinner=False)
+def fetch_themes() -> list:
+    """Fetches the available QCM themes (cached; failures are not cached)."""
+    response = get_session().get(API_QCM_URL + "/themes", timeout=500)
+    response.raise_for_status()
+    return response.json().get("themes", [])
+
+
+@st.cache_data(ttl=QCM_CACHE_TTL, show_spinner=False)
+def fetch_qcm(theme: str, n: int) -> list:
+    """Fetches a generated QCM for a theme (cached for a short time)."""
+    response = get_session().get(
+        API_QCM_URL, params={"n": n, "focus_area": theme}, timeout=500)
+    response.raise_for_status()
+    return response.json().get("questions", [])
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_qcm_pdf(questions_json: str) -> bytes:
+    """Renders a QCM as PDF, memoized per quiz."""
+    pdf_content = BytesIO()
+    c = canvas.Canvas(pdf_content, pagesize=letter)
+    c.setFont("Helvetica", 12)
+    y_position = 750
+
+    for i, q in enumerate(json.loads(questions_json), start=1):
+        c.drawString(50, y_position, f"Q{i}: {q['question']}")
+        y_position -= 20
+        for option in q["options"]:
+            c.drawString(70, y_position, f"- {option}")
+            y_position -= 15
+        c.drawString(
+            50, y_position, f"✅ Correct Answer: {q['correct_answer']}")
+        y_position -= 30
+
+    c.save()
+    return pdf_content.getvalue()
+
+
+@st.cache_resource
+def get_feedback_store() -> FeedbackStore:
+    """Opens the feedback store, importing the legacy CSV file once."""
+    store = FeedbackStore()
+    if os.path.exists(GENERAL_FEEDBACK_FILE):
+        store.import_csv(GENERAL_FEEDBACK_FILE)
+    return store
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def render_feedback_chart(score_counts: tuple) -> bytes:
+    """Renders the score histogram as PNG, memoized per distribution."""
+    scores, counts = zip(*score_counts)
+    fig, ax = plt.subplots(figsize=(8, 5))
+    ax.bar(scores, counts, color="skyblue")
+    ax.set_xlabel("Score")
+    ax.set_ylabel("Nombre d'occurrences")
+    ax.set_title("Fréquence des Scores")
+    ax.set_xticks(range(1, 6))
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+
+    image = BytesIO()
+    fig.savefig(image, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return image.getvalue()
 
 
 def listen_and_transcribe():
@@ -131,7 +209,7 @@ with tab_chat:
         question = st.chat_input("Type your message...")
         if question:
             try:
-                response = requests.post(
+                response = get_session().post(
                     API_ANSWER_URL, json={
                         "question": question}, timeout=500)
                 if response.status_code == 200:
@@ -167,7 +245,7 @@ with tab_chat:
             spoken_text = listen_and_transcribe()
             if spoken_text:
                 try:
-                    response = requests.post(
+                    response = get_session().post(
                         API_ANSWER_URL, json={
                             "question": spoken_text}, timeout=500)
                     if response.status_code == 200:
@@ -204,11 +282,10 @@ with tab_QCM:
     st.header("📚 QCM Practice")
     st.write("Test your knowledge with multiple-choice questions.")
 
-    # Récupérer les focus_area disponibles depuis l'API
-    response = requests.get(API_QCM_URL + "/themes", timeout=500)
-    if response.status_code == 200:
-        available_themes = response.json().get("themes", [])
-    else:
+    # Récupérer les focus_area disponibles depuis l'API (mis en cache)
+    try:
+        available_themes = fetch_themes()
+    except requests.exceptions.RequestException:
         available_themes = []
 
     # Choix du thème
@@ -218,46 +295,27 @@ with tab_QCM:
         st.session_state.qcm_questions = []
 
     if st.button("Generate QCM") and selected_theme:
-        response = requests.get(
-            API_QCM_URL,
-            params={
-                "n": 5,
-                "focus_area": selected_theme},
-            timeout=500)
-        if response.status_code == 200:
-            st.session_state.qcm_questions = response.json().get("questions", [])
+        try:
+            st.session_state.qcm_questions = fetch_qcm(selected_theme, 5)
+            st.session_state.qcm_pdf = None
             st.success(
                 f"✅ QCM Generated for {selected_theme}! You can now take the test or download it.")
-        else:
+        except requests.exceptions.RequestException:
             st.error("⚠️ Failed to fetch QCM questions.")
 
-    # Affichage des questions et téléchargement
+    # Téléchargement : le PDF n'est généré qu'à la demande
     if st.session_state.qcm_questions:
-        pdf_content = BytesIO()
-        c = canvas.Canvas(pdf_content, pagesize=letter)
-        c.setFont("Helvetica", 12)
-        Y_POSITION = 750
-
-        for i, q in enumerate(st.session_state.qcm_questions, start=1):
-            c.drawString(50, Y_POSITION, f"Q{i}: {q['question']}")
-            Y_POSITION -= 20
-            for option in q["options"]:
-                c.drawString(70, Y_POSITION, f"- {option}")
-                Y_POSITION -= 15
-            c.drawString(
-                50, Y_POSITION, f"✅ Correct Answer: {
-                    q['correct_answer']}")
-            Y_POSITION -= 30
-
-        c.save()
-        pdf_content.seek(0)
-
-        st.download_button(
-            label="📥 Download QCM as PDF",
-            data=pdf_content,
-            file_name="QCM.pdf",
-            mime="application/pdf"
-        )
+        if st.button("📄 Prepare PDF"):
+            st.session_state.qcm_pdf = build_qcm_pdf(
+                json.dumps(st.session_state.qcm_questions, sort_keys=True))
+
+        if st.session_state.get("qcm_pdf"):
+            st.download_button(
+                label="📥 Download QCM as PDF",
+                data=st.session_state.qcm_pdf,
+                file_name="QCM.pdf",
+                mime="application/pdf"
+            )
 
     # Soumission des réponses utilisateur
     if st.session_state.qcm_questions:
@@ -288,49 +346,18 @@ with tab_feedback:
         "Any suggestions to improve the application?")
 
     if st.button("Submit General Feedback"):
-        df = pd.DataFrame([[general_score, general_comment]],
-                          columns=["score", "comment"])
-        if is_feedback_file_empty(GENERAL_FEEDBACK_FILE):
-            df.to_csv(
-                GENERAL_FEEDBACK_FILE,
-                mode='w',
-                header=True,
-                index=False)
-        else:
-            df.to_csv(
-                GENERAL_FEEDBACK_FILE,
-                mode='a',
-                header=False,
-                index=False)
+        get_feedback_store().add(general_score, general_comment)
         st.success("✅ Thank you for your feedback!")
 
-    # Charger les feedbacks existants
-    if os.path.exists(GENERAL_FEEDBACK_FILE):
-        df_feedback = pd.read_csv(GENERAL_FEEDBACK_FILE)
-    else:
-        df_feedback = pd.DataFrame(columns=["score", "comment"])
-
-    if not df_feedback.empty:
-        # Compter le nombre d'occurrences de chaque score
-        score_counts = df_feedback["score"].value_counts().sort_index()
-
-        # Calcul de la moyenne générale des feedbacks
-        mean_general = df_feedback["score"].mean()
+    # Agrégats lus depuis les compteurs par score (temps constant)
+    aggregates = get_feedback_store().aggregates()
 
+    if aggregates.total:
         # Affichage du graphique
-        fig, ax = plt.subplots(figsize=(8, 5))
-        ax.bar(score_counts.index, score_counts.values, color="skyblue")
-        ax.set_xlabel("Score")
-        ax.set_ylabel("Nombre d'occurrences")
-        ax.set_title("Fréquence des Scores")
-        ax.set_xticks(range(1, 6))
-        ax.grid(axis="y", linestyle="--", alpha=0.7)
-
-        st.pyplot(fig)
+        st.image(render_feedback_chart(tuple(aggregates.counts.items())))
 
         # Affichage du message
         st.write(
-            f"### La moyenne générale des feedbacks est de {
-                mean_general:.2f}.")
+            f"### La moyenne générale des feedbacks est de {aggregates.mean:.2f}.")
     else:
         st.write("### Aucun feedback enregistré pour le moment.")
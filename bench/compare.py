@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files produced by ``bench/run.py``.
+
+Exits with status 1 when a benchmark present in both files got slower than
+the allowed threshold, so it can gate a CI job.
+
+Usage:
+    python bench/compare.py bench/results/base.json bench/results/head.json
+"""
+
+import sys
+import json
+import argparse
+
+
+def load(path: str) -> dict:
+    """Reads a benchmark results file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(base: dict, head: dict, metric: str, threshold: float) -> list:
+    """Returns (name, base, head, ratio, regressed) rows for shared benchmarks."""
+    rows = []
+    for name, head_stats in head["results"].items():
+        base_stats = base["results"].get(name)
+        if base_stats is None:
+            continue
+        base_value, head_value = base_stats[metric], head_stats[metric]
+        ratio = head_value / base_value if base_value else float("inf")
+        rows.append((name, base_value, head_value, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--metric", default="p50_ms",
+                        choices=["mean_ms", "p50_ms", "p95_ms", "min_ms"])
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown ratio before failing (0.10 = +10%%).")
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    rows = compare(base, head, args.metric, args.threshold)
+
+    print(f"{base['commit']} -> {head['commit']} ({args.metric})")
+    for name, base_value, head_value, ratio, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<32} {base_value:>10.3f} {head_value:>10.3f} "
+              f"{(ratio - 1) * 100:>+8.1f}% {flag}")
+
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
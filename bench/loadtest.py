@@ -0,0 +1,293 @@
+"""
+Load-test harness replaying recorded or synthetic traffic against the API.
+
+A traffic log is a JSONL file with one request per line:
+    {"method": "POST", "path": "/answer", "json": {"question": "..."}, "offset": 0.42}
+    {"method": "GET", "path": "/qcm", "params": {"n": 5}}
+``offset`` (seconds since the start of the recording) is optional and only
+used with ``--replay-timing``. Without a log, synthetic traffic is generated
+for /answer, /get_sources, /qcm and /qcm/themes.
+
+Two load models are supported:
+- closed loop (``--concurrency N``): N clients send requests back to back;
+- open loop (``--rate R``): requests arrive as a Poisson process at R req/s,
+  and latency is measured from the scheduled arrival time, so queueing
+  delay is not hidden when the server saturates.
+
+With ``--spawn-server`` the harness starts ``uvicorn api:app`` itself with
+the fake LLM backend, and can sweep several worker counts and rates to find
+the saturation point.
+
+Usage:
+    python bench/loadtest.py --spawn-server --workers 1,2,4 --rate 5,10,20,40
+    python bench/loadtest.py --log traffic.jsonl --concurrency 16 --duration 60
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHONPATH = [ROOT, os.path.join(ROOT, "tools"), os.path.join(ROOT, "database_init")]
+
+SAMPLE_QUESTIONS = [
+    "What are the symptoms of Glaucoma?",
+    "What causes High Blood Pressure?",
+    "How to prevent Diabetes?",
+    "What are the treatments for Asthma?",
+    "Who is at risk for Osteoporosis?",
+    "What is Parkinson's Disease?",
+    "How to diagnose Lung Cancer?",
+    "What are the genetic changes related to cystic fibrosis?",
+    "Is Huntington disease inherited?",
+    "What is the outlook for Alzheimer's Disease?",
+]
+
+# Répartition du trafic synthétique entre les endpoints
+SYNTHETIC_MIX = {
+    "/answer": 0.6,
+    "/get_sources": 0.25,
+    "/qcm": 0.05,
+    "/qcm/themes": 0.1,
+}
+
+
+def synthetic_request(rng: random.Random) -> dict:
+    """Draws one request from the synthetic traffic mix."""
+    path = rng.choices(list(SYNTHETIC_MIX), weights=SYNTHETIC_MIX.values())[0]
+    if path in ("/answer", "/get_sources"):
+        return {"method": "POST", "path": path,
+                "json": {"question": rng.choice(SAMPLE_QUESTIONS)}}
+    if path == "/qcm":
+        return {"method": "GET", "path": path, "params": {"n": 5}}
+    return {"method": "GET", "path": path}
+
+
+def load_log(path: str) -> list:
+    """Reads a JSONL traffic log."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Recorder:
+    """Collects latencies and errors per endpoint, thread-safely."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, path: str, latency: float, ok: bool):
+        """Records one completed request."""
+        with self._lock:
+            self.latencies[path].append(latency)
+            if not ok:
+                self.errors[path] += 1
+
+    def report(self, elapsed: float) -> dict:
+        """Per-endpoint throughput, latency percentiles and error rate."""
+        report = {}
+        for path, latencies in sorted(self.latencies.items()):
+            values = np.asarray(latencies) * 1000
+            report[path] = {
+                "requests": int(values.size),
+                "throughput_rps": round(values.size / elapsed, 3),
+                "error_rate": round(self.errors[path] / values.size, 4),
+                "p50_ms": round(float(np.percentile(values, 50)), 2),
+                "p95_ms": round(float(np.percentile(values, 95)), 2),
+                "p99_ms": round(float(np.percentile(values, 99)), 2),
+            }
+        return report
+
+
+def send(session, base_url: str, request: dict, recorder: Recorder,
+         scheduled: float, timeout: float):
+    """Sends one request; latency counts from its scheduled start."""
+    try:
+        response = session.request(
+            request.get("method", "GET"), base_url + request["path"],
+            json=request.get("json"), params=request.get("params"),
+            timeout=timeout)
+        ok = response.status_code < 400
+    except requests.exceptions.RequestException:
+        ok = False
+    recorder.add(request["path"], time.perf_counter() - scheduled, ok)
+
+
+def request_stream(log: list, rng: random.Random):
+    """Yields requests from the log in a loop, or synthetic ones forever."""
+    while True:
+        if log:
+            yield from log
+        else:
+            yield synthetic_request(rng)
+
+
+def run_closed_loop(base_url, log, concurrency, duration, timeout, rng) -> dict:
+    """N clients sending requests back to back for ``duration`` seconds."""
+    session = make_session(concurrency)
+    recorder = Recorder()
+    stream = request_stream(log, rng)
+    stream_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            with stream_lock:
+                request = next(stream)
+            send(session, base_url, request, recorder, time.perf_counter(), timeout)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - start)
+
+
+def run_open_loop(base_url, log, rate, duration, timeout, rng,
+                  replay_timing=False, max_in_flight=256) -> dict:
+    """Requests arriving at ``rate`` req/s (Poisson) or at their recorded offsets."""
+    session = make_session(max_in_flight)
+    recorder = Recorder()
+    start = time.perf_counter()
+
+    if replay_timing and log:
+        schedule = sorted(
+            ((r.get("offset", 0.0), r) for r in log
+             if r.get("offset", 0.0) <= duration),
+            key=lambda item: item[0])
+    else:
+        schedule, arrival, stream = [], 0.0, request_stream(log, rng)
+        while True:
+            arrival += rng.expovariate(rate)
+            if arrival > duration:
+                break
+            schedule.append((arrival, next(stream)))
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for offset, request in schedule:
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, session, base_url, request, recorder,
+                            scheduled, timeout)
+    return recorder.report(time.perf_counter() - start)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """HTTP session whose connection pool matches the load."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    return session
+
+
+def spawn_server(workers: int, port: int, llm_mode: str) -> subprocess.Popen:
+    """Starts uvicorn with the stubbed LLM and waits until it answers."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(PYTHONPATH), LLM_MODE=llm_mode)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env)
+    for _ in range(600):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become ready")
+
+
+def print_report(label: str, report: dict):
+    """Prints one run as a table."""
+    print(f"\n== {label} ==")
+    print(f"{'endpoint':<14}{'req':>7}{'rps':>9}{'err%':>7}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, stats in report.items():
+        print(f"{path:<14}{stats['requests']:>7}{stats['throughput_rps']:>9.2f}"
+              f"{stats['error_rate'] * 100:>7.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--log", help="JSONL traffic log (default: synthetic).")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")],
+                        help="Closed loop: comma-separated client counts.")
+    parser.add_argument("--rate", type=lambda s: [float(x) for x in s.split(",")],
+                        help="Open loop: comma-separated arrival rates (req/s).")
+    parser.add_argument("--replay-timing", action="store_true",
+                        help="Open loop at the log's recorded offsets.")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="Seconds per run.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="Start uvicorn locally for each worker count.")
+    parser.add_argument("--workers", default="1",
+                        type=lambda s: [int(x) for x in s.split(",")],
+                        help="Comma-separated uvicorn worker counts (--spawn-server).")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-mode", default="fake",
+                        help="LLM_MODE of the spawned server.")
+    parser.add_argument("--output", help="Write all runs to this JSON file.")
+    args = parser.parse_args()
+    if args.replay_timing and not args.log:
+        parser.error("--replay-timing requires --log")
+
+    log = load_log(args.log) if args.log else []
+    if args.replay_timing:
+        loads = [("replay", None)]
+    elif args.rate:
+        loads = [("rate", rate) for rate in args.rate]
+    else:
+        loads = [("concurrency", c) for c in (args.concurrency or [8])]
+
+    runs = []
+    for workers in (args.workers if args.spawn_server else [None]):
+        server = spawn_server(workers, args.port, args.llm_mode) if workers else None
+        base_url = f"http://127.0.0.1:{args.port}" if server else args.url
+        try:
+            for kind, value in loads:
+                rng = random.Random(args.seed)
+                if kind == "concurrency":
+                    report = run_closed_loop(
+                        base_url, log, value, args.duration, args.timeout, rng)
+                else:
+                    report = run_open_loop(
+                        base_url, log, value, args.duration, args.timeout, rng,
+                        replay_timing=kind == "replay")
+                label = f"workers={workers or '?'} {kind}={value or 'recorded'}"
+                print_report(label, report)
+                runs.append({"workers": workers, kind: value, "endpoints": report})
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
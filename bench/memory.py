@@ -0,0 +1,124 @@
+"""
+Memory benchmark: resident memory of the API versus gunicorn worker count.
+
+Starts ``gunicorn api:app`` (see gunicorn.conf.py) with 1, 2, 4, ... workers,
+with and without ``preload_app``, waits until every worker has served a
+request, and sums the memory of the master and its workers. RSS counts shared
+pages once per process; PSS splits them between the processes sharing them,
+so the PSS total is the real footprint (Linux only).
+
+Usage:
+    python bench/memory.py --workers 1,2,4,8 --output bench/results/memory.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHONPATH = [ROOT, os.path.join(ROOT, "tools"), os.path.join(ROOT, "database_init")]
+
+
+def read_memory(pid: int) -> dict:
+    """RSS and PSS of a process in MiB, from /proc/<pid>/smaps_rollup."""
+    memory = {"rss": 0.0, "pss": 0.0}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                memory[key.lower()] = int(value.split()[0]) / 1024
+    return memory
+
+
+def children(pid: int) -> list:
+    """Direct child processes of ``pid``."""
+    with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure(workers: int, preload: bool, port: int, settle: float) -> dict:
+    """Starts gunicorn, exercises each worker and sums the process memory."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(PYTHONPATH),
+        LLM_MODE=os.environ.get("LLM_MODE", "fake"),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_PRELOAD="true" if preload else "false",
+        PORT=str(port),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "api:app", "-c", "gunicorn.conf.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 600
+        while len(children(process.pid)) < workers or not ready(url):
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("gunicorn failed to start")
+            time.sleep(1)
+
+        # Quelques requêtes par worker pour charger l'état initialisé paresseusement
+        for _ in range(workers * 4):
+            requests.post(f"{url}/get_sources",
+                          json={"question": "What causes High Blood Pressure?"},
+                          timeout=600)
+        time.sleep(settle)
+
+        pids = [process.pid] + children(process.pid)
+        per_process = [read_memory(pid) for pid in pids]
+        return {
+            "workers": workers,
+            "preload": preload,
+            "rss_mib": round(sum(m["rss"] for m in per_process), 1),
+            "pss_mib": round(sum(m["pss"] for m in per_process), 1),
+            "master_pss_mib": round(per_process[0]["pss"], 1),
+            "worker_pss_mib": [round(m["pss"], 1) for m in per_process[1:]],
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def ready(url: str) -> bool:
+    """Whether the server answers HTTP requests."""
+    try:
+        requests.get(f"{url}/docs", timeout=1)
+        return True
+    except requests.exceptions.RequestException:
+        return False
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4",
+                        type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Seconds to wait before sampling memory.")
+    parser.add_argument("--output", help="Write the measurements to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'preload':<9}{'workers':>8}{'RSS MiB':>11}{'PSS MiB':>11}{'PSS/worker':>12}")
+    for preload in (False, True):
+        for workers in args.workers:
+            result = measure(workers, preload, args.port, args.settle)
+            results.append(result)
+            per_worker = sum(result["worker_pss_mib"]) / max(1, workers)
+            print(f"{str(preload):<9}{workers:>8}{result['rss_mib']:>11.1f}"
+                  f"{result['pss_mib']:>11.1f}{per_worker:>12.1f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
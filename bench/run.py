@@ -0,0 +1,269 @@
+"""
+End-to-end latency benchmark suite.
+
+Generates synthetic corpora, runs the retrieval and answer pipeline against
+the stubbed LLM (``LLM_MODE=fake``) and an in-memory corpus, and stores the
+timings as JSON so runs from different commits can be compared with
+``bench/compare.py``.
+
+Usage:
+    python bench/run.py --sizes 10000,100000,1000000
+    python bench/run.py --sizes 10000 --postgres   # also hits /qcm on the real DB
+    python bench/run.py --sizes 1000000 --shards 4 # adds sharded retrieval
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHONPATH = [ROOT, os.path.join(ROOT, "tools"), os.path.join(ROOT, "database_init")]
+for path in reversed(PYTHONPATH):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Le LLM est toujours simulé pendant les benchmarks, sauf demande explicite
+os.environ.setdefault("LLM_MODE", "fake")
+
+import numpy as np  # pylint: disable=wrong-import-position
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+VOCABULARY = (
+    "patient symptoms treatment disease chronic acute infection therapy "
+    "diagnosis risk blood pressure heart lung kidney liver brain cells "
+    "genetic inherited mutation protein enzyme hormone insulin glucose "
+    "immune inflammation pain fever fatigue dose medication surgery "
+    "prevention screening children adults elderly syndrome disorder "
+    "cancer tumor virus bacteria vaccine muscle bone skin nerve vision"
+).split()
+
+
+def summarize(timings: list) -> dict:
+    """Summary statistics of a list of durations, in milliseconds."""
+    values = np.asarray(timings) * 1000
+    return {
+        "n": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def measure(fn, inputs: list, repeat: int, warmup: int = 1) -> dict:
+    """Times ``fn`` over ``repeat`` calls, cycling through ``inputs``."""
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def synthetic_corpus(size: int, planted: list, embed, seed: int = 0):
+    """Random corpus of ``size`` documents; ``planted`` texts get their real
+    embeddings so that queries for them go through the full matching path.
+    The dimension is the encoder's, since planted rows come from it."""
+    rng = np.random.default_rng(seed)
+    planted_embeddings = embed(planted)
+    embeddings = rng.standard_normal(
+        (size, planted_embeddings.shape[1]), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    words = np.array(VOCABULARY)
+    answers = [" ".join(rng.choice(words, n))
+               for n in rng.integers(20, 60, size)]
+
+    positions = rng.choice(size, len(planted), replace=False)
+    embeddings[positions] = planted_embeddings
+    for position, text in zip(positions, planted):
+        answers[position] = text
+
+    sources = [f"synthetic://{i}" for i in range(size)]
+    focus_areas = [f"Topic {i % 50}" for i in range(size)]
+    return answers, sources, focus_areas, embeddings
+
+
+def check_same_top_k(expected: list, actual: list):
+    """Fails unless two retrievals returned the same candidates per query."""
+    for query, (want, got) in enumerate(zip(expected, actual)):
+        if (len(want) != len(got)
+                or {i for i, _ in want} != {i for i, _ in got}
+                or not np.allclose([s for _, s in want], [s for _, s in got],
+                                   atol=1e-5)):
+            raise RuntimeError(
+                f"Sharded top-k differs from single-process top-k "
+                f"for query {query}: {got} != {want}")
+
+
+def bench_cold_start(runs: int) -> dict:
+    """Time to import the API (embedding model and LLM client included)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(PYTHONPATH))
+    code = ("import time; start = time.perf_counter(); import api; "
+            "print(time.perf_counter() - start)")
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, env=env,
+            check=True, capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return summarize(timings)
+
+
+def git_commit() -> str:
+    """Current commit hash, or 'unknown' outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> dict:
+    """Runs every benchmark and returns the results document."""
+    results = {}
+
+    print("Measuring cold start...")
+    results["cold_start"] = bench_cold_start(args.cold_runs)
+
+    # pylint: disable=import-outside-toplevel
+    from fastapi.testclient import TestClient
+    import api
+    import agents
+    import retrieve
+
+    client = TestClient(api.app)
+    rng = np.random.default_rng(args.seed)
+    words = np.array(VOCABULARY)
+    questions = [" ".join(rng.choice(words, 30)) for _ in range(args.queries)]
+
+    print("Measuring compute_embedding...")
+    results["compute_embedding"] = measure(
+        agents.compute_embedding, questions, args.repeat)
+
+    if args.postgres:
+        print("Measuring /qcm on the configured database...")
+        results["/qcm"] = measure(
+            lambda _: client.get("/qcm", params={"n": 5}).raise_for_status(),
+            [None], max(1, args.repeat // 10))
+    else:
+        print("Measuring create_mcq (in-memory questions)...")
+        results["create_mcq"] = measure(
+            lambda q: agents.create_mcq(q, q, "Synthetic"),
+            questions, args.repeat)
+
+    for size in args.sizes:
+        print(f"Building synthetic corpus of {size} documents...")
+        start = time.perf_counter()
+        corpus = synthetic_corpus(
+            size, questions, agents.compute_embeddings, args.seed)
+        index = retrieve.build_corpus_index_from_arrays(*corpus)
+        del corpus
+        results[f"build_corpus_index[{size}]"] = summarize(
+            [time.perf_counter() - start])
+        retrieve.use_corpus_index(index)
+
+        query_embeddings = [agents.compute_embedding(q) for q in questions]
+        pairs = list(zip(questions, query_embeddings))
+
+        print(f"Measuring retrieval on {size} documents...")
+        results[f"top_k_candidates[{size}]"] = measure(
+            lambda p: retrieve.top_k_candidates(index, [p[1]]),
+            pairs, args.repeat)
+        candidates = [retrieve.top_k_candidates(index, [e])[0] for _, e in pairs]
+        results[f"metrics[{size}]"] = measure(
+            lambda c: retrieve.rerank_candidates(index, [c[0]], [c[1]]),
+            list(zip(questions, candidates)), args.repeat)
+        results[f"find_best_match[{size}]"] = measure(
+            lambda p: retrieve.find_best_match(*p), pairs, args.repeat)
+
+        print(f"Measuring /answer on {size} documents...")
+        results[f"/answer[{size}]"] = measure(
+            lambda q: client.post("/answer", json={"question": q}).raise_for_status(),
+            questions, args.repeat)
+
+        if args.shards > 1:
+            print(f"Measuring retrieval on {size} documents over {args.shards} shards...")
+            sharded = retrieve.shard_corpus_index(index, args.shards, args.shard_timeout)
+            # Seuil désactivé : on compare les k meilleurs candidats bruts
+            check_same_top_k(
+                retrieve.top_k_candidates(index, query_embeddings, threshold=-1.0),
+                retrieve.top_k_candidates(sharded, query_embeddings, threshold=-1.0))
+            results[f"top_k_candidates[{size}, {args.shards} shards]"] = measure(
+                lambda p: retrieve.top_k_candidates(sharded, [p[1]]),
+                pairs, args.repeat)
+            retrieve.use_corpus_index(sharded)
+            results[f"find_best_match[{size}, {args.shards} shards]"] = measure(
+                lambda p: retrieve.find_best_match(*p), pairs, args.repeat)
+            sharded.searcher.close()
+
+        retrieve.use_corpus_index(None)
+        del index
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "config": {
+            "sizes": args.sizes,
+            "dim": agents.embedding_model.get_sentence_embedding_dimension(),
+            "repeat": args.repeat,
+            "queries": args.queries,
+            "llm_mode": os.environ["LLM_MODE"],
+            "postgres": args.postgres,
+            "shards": args.shards,
+        },
+        "results": results,
+    }
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        type=lambda s: [int(x) for x in s.split(",")],
+                        help="Comma-separated synthetic corpus sizes.")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="Timed calls per benchmark.")
+    parser.add_argument("--queries", type=int, default=20,
+                        help="Distinct query texts planted in the corpus.")
+    parser.add_argument("--cold-runs", type=int, default=3,
+                        help="Cold start measurements (one subprocess each).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Also benchmark retrieval split across N shard processes.")
+    parser.add_argument("--shard-timeout", type=float, default=5.0,
+                        help="Per-shard deadline in seconds.")
+    parser.add_argument("--postgres", action="store_true",
+                        help="Benchmark /qcm against the configured database.")
+    parser.add_argument("--output", help="Results file (default: bench/results/).")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{report['timestamp'].replace(':', '')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report["results"].items():
+        print(f"{name:<32} p50={stats['p50_ms']:>10.3f} ms  "
+              f"p95={stats['p95_ms']:>10.3f} ms")
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,10 @@ from fastapi import HTTPException
 
 # Internal modules
 from config import TABLE_NAME, DB_PASSWORD, DB_USER, DB_NAME, DB_HOST, DB_PORT
+from telemetry import timed
 
 
+@timed("db_connect")
 def connect_db():
     """Establish a secure connection to PostgreSQL."""
     try:
@@ -4,89 +4,200 @@ Chatbot Evaluation Script.
 This script tests the chatbot on a set of random questions and computes
 various evaluation metrics such as Cosine Similarity, Jaccard Similarity,
 METEOR Score, and BERTScore.
+
+Questions are sent concurrently through a pooled HTTP session and every
+answer is appended to a JSONL results file as soon as it arrives, so an
+interrupted run resumes where it stopped. Metrics are computed in batch
+once all answers are collected.
 """
 
+import os
+import json
+import time
+import argparse
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from bert_score import score as bert_score
+from requests.adapters import HTTPAdapter
 from nltk.translate.meteor_score import meteor_score
 from utils import get_random_questions
-from agents import compute_embedding
+from agents import compute_embeddings
+from retrieve import get_bert_scorer
 
 # Ignore warnings
 warnings.simplefilter("ignore")
 
+API_ANSWER_URL = "http://127.0.0.1:8000/answer"
+RESULTS_FILE = "eval/results.jsonl"
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """Creates an HTTP session whose connection pool matches the concurrency."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def load_questions(results_file: str, n: int):
+    """Loads the question set of a previous run, or samples and saves a new one."""
+    questions_file = results_file + ".questions.json"
+    if os.path.exists(questions_file):
+        with open(questions_file, encoding="utf-8") as f:
+            return [tuple(item) for item in json.load(f)]
+
+    questions_answers = [tuple(row) for row in get_random_questions(n)]
+    with open(questions_file, "w", encoding="utf-8") as f:
+        json.dump(questions_answers, f, ensure_ascii=False)
+    return questions_answers
+
+
+def load_results(results_file: str) -> dict:
+    """Reads the per-item results already written, keyed by question index."""
+    results = {}
+    if not os.path.exists(results_file):
+        return results
+    with open(results_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Ligne tronquée par un arrêt brutal
+            if item.get("status") == 200:
+                results[item["index"]] = item
+    return results
+
+
+def ask_chatbot(session, index: int, question: str, true_answer: str) -> dict:
+    """Sends one question to the chatbot and returns its per-item record."""
+    start_time = time.perf_counter()
+    try:
+        response = session.post(
+            API_ANSWER_URL, json={"question": question}, timeout=500)
+        status = response.status_code
+        predicted_answer = response.json().get("answer", "") if status == 200 else ""
+    except requests.exceptions.RequestException as e:
+        status, predicted_answer = None, ""
+        print(f"Request failed for question {index}: {e}")
+
+    return {
+        "index": index,
+        "question": question,
+        "true_answer": true_answer,
+        "predicted_answer": predicted_answer,
+        "status": status,
+        "latency": round(time.perf_counter() - start_time, 4),
+    }
+
 
-def evaluate_chatbot(n):
+def compute_metrics(items: list) -> dict:
+    """Computes all quality metrics in batch for the collected answers."""
+    true_answers = [item["true_answer"] for item in items]
+    predicted_answers = [item["predicted_answer"] for item in items]
+
+    # Cosine Similarity : embeddings normalisés, un seul lot pour tout
+    embeddings = compute_embeddings(true_answers + predicted_answers)
+    true_embeddings, predicted_embeddings = np.split(embeddings, 2)
+    cosine_similarities = np.sum(true_embeddings * predicted_embeddings, axis=1)
+
+    # Jaccard Similarity
+    jaccard_scores = []
+    for true_answer, predicted_answer in zip(true_answers, predicted_answers):
+        true_tokens = set(true_answer.split())
+        pred_tokens = set(predicted_answer.split())
+        union = true_tokens | pred_tokens
+        jaccard_scores.append(len(true_tokens & pred_tokens) / len(union) if union else 0)
+
+    # METEOR Score
+    meteor_scores = [
+        meteor_score([true_answer.split()], predicted_answer.split())
+        for true_answer, predicted_answer in zip(true_answers, predicted_answers)
+    ]
+
+    # BERT Score : modèle chargé une seule fois, toutes les paires en un lot
+    _, _, f1_scores = get_bert_scorer().score(predicted_answers, true_answers)
+
+    return {
+        "cosine_similarity": np.asarray(cosine_similarities, dtype=float),
+        "jaccard_similarity": np.asarray(jaccard_scores),
+        "meteor_score": np.asarray(meteor_scores),
+        "bert_score": f1_scores.numpy(),
+    }
+
+
+def evaluate_chatbot(n, results_file=RESULTS_FILE, workers=8):
     """Test the chatbot on n questions and compute evaluation metrics."""
-    questions_answers = get_random_questions(n)
-    cosine_similarities, jaccard_scores, meteor_scores, bert_scores_list = [], [], [], []
+    questions_answers = load_questions(results_file, n)
+    done = load_results(results_file)
+    pending = [(i, q, a) for i, (q, a) in enumerate(questions_answers)
+               if i not in done]
 
     print("\n--- Chatbot Evaluation ---\n")
-
-    for i, (question, true_answer) in enumerate(questions_answers, 1):
-        response = requests.post(
-            "http://127.0.0.1:8000/answer",
-            json={
-                "question": question},
-            timeout=500)
-
-        if response.status_code == 200:
-            data = response.json()
-            predicted_answer = data.get("answer", "")
-
-            # Cosine Similarity
-            true_embedding = compute_embedding(true_answer)
-            predicted_embedding = compute_embedding(predicted_answer)
-            cosine_sim = cosine_similarity(
-                [true_embedding], [predicted_embedding])[0][0]
-            cosine_similarities.append(cosine_sim)
-
-            # Jaccard Similarity
-            true_tokens, pred_tokens = set(
-                true_answer.split()), set(
-                predicted_answer.split())
-            jaccard = len(true_tokens & pred_tokens) / len(true_tokens |
-                                                           pred_tokens) if true_tokens | pred_tokens else 0
-            jaccard_scores.append(jaccard)
-
-            # METEOR Score
-            meteor = meteor_score([true_answer.split()],
-                                  predicted_answer.split())
-            meteor_scores.append(meteor)
-
-            # BERT Score
-            _, _, f1_score = bert_score(
-                [predicted_answer], [true_answer], lang="en")
-            bert_scores_list.append(f1_score.mean().item())
-
-            # Affichage des résultats pour chaque requête
-            print(f"**Question {i}:** {question}")
-            print(f"**Réponse attendue:** {true_answer}")
-            print(f"**Réponse du chatbot:** {predicted_answer}")
-            print(f"**Cosine Similarity:** {cosine_sim:.4f}")
-            print(f"**Jaccard Similarity:** {jaccard:.4f}")
-            print(f"**METEOR Score:** {meteor:.4f}")
-            print(f" **BERT Score:** {f1_score.mean().item():.4f}\n")
-            print("-" * 60)
+    print(f"{len(done)} answers already collected, {len(pending)} to go.")
+
+    session = make_session(workers)
+    with open(results_file, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(ask_chatbot, session, i, q, a)
+                   for i, q, a in pending]
+        for future in as_completed(futures):
+            item = future.result()
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            out.flush()
+            if item["status"] == 200:
+                done[item["index"]] = item
+
+    items = [done[i] for i in sorted(done)]
+    if not items:
+        print("No successful answer to evaluate.")
+        return {}
+
+    metrics = compute_metrics(items)
+    latencies = np.array([item["latency"] for item in items])
+
+    # Affichage des résultats pour chaque requête
+    for i, item in enumerate(items):
+        print(f"**Question {item['index'] + 1}:** {item['question']}")
+        print(f"**Réponse attendue:** {item['true_answer']}")
+        print(f"**Réponse du chatbot:** {item['predicted_answer']}")
+        for metric, values in metrics.items():
+            print(f"**{metric.replace('_', ' ').title()}:** {values[i]:.4f}")
+        print("-" * 60)
 
     # Compute averages
-    results = {
-        "cosine_similarity": np.mean(cosine_similarities),
-        "jaccard_similarity": np.mean(jaccard_scores),
-        "meteor_score": np.mean(meteor_scores),
-        "bert_score": np.mean(bert_scores_list)
-    }
+    results = {metric: float(np.mean(values)) for metric, values in metrics.items()}
+    results.update({
+        f"latency_p{p}": float(np.percentile(latencies, p)) for p in (50, 90, 95, 99)
+    })
+    results["answered"] = len(items)
+    results["failed"] = len(questions_answers) - len(items)
+
+    with open(results_file + ".summary.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
 
     #  Affichage final des moyennes
     print("\n--- **Final Chatbot Evaluation Summary** ---")
     for metric, value in results.items():
-        print(f"{metric.replace('_', ' ').title()} Average: {value:.4f}")
+        if metric.startswith("latency"):
+            print(f"{metric.replace('_', ' ').title()}: {value:.4f}s")
+        elif isinstance(value, int):
+            print(f"{metric.title()}: {value}")
+        else:
+            print(f"{metric.replace('_', ' ').title()} Average: {value:.4f}")
 
     return results
 
 
 if __name__ == "__main__":
-    evaluate_chatbot(10)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=10,
+                        help="Number of questions (ignored when resuming).")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Number of concurrent requests.")
+    parser.add_argument("--results", default=RESULTS_FILE,
+                        help="Per-item JSONL results file; reused to resume.")
+    args = parser.parse_args()
+    evaluate_chatbot(args.n, args.results, args.workers)
@@ -0,0 +1,46 @@
+"""
+Gunicorn configuration for a fork-friendly multi-worker deployment of api:app.
+
+The application is imported once in the master (``preload_app``), which loads
+the embedding model, the BERTScore model and the corpus index before forking.
+Workers then share those pages copy-on-write, and the corpus matrix itself is
+a read-only mmap (``CORPUS_MMAP_DIR``) shared through the page cache, so each
+extra worker only costs its private heap.
+
+Usage:
+    CORPUS_MMAP_DIR=/var/cache/genai WEB_CONCURRENCY=4 gunicorn api:app
+"""
+
+import gc
+import os
+
+# Avoid tokenizers spawning threads in the master before fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# api.py imports the tools/ and database_init/ modules by their flat names
+ROOT = os.path.dirname(os.path.abspath(__file__))
+pythonpath = ",".join(
+    os.path.join(ROOT, directory) for directory in ("tools", "database_init"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def when_ready(server):
+    """Warms the shared state in the master, then freezes it for the GC."""
+    if not server.cfg.preload_app:
+        return
+    import api  # pylint: disable=import-outside-toplevel
+    api.warm_up()
+    # Objects allocated so far are never scanned by the GC again, so the
+    # collector does not write to (and un-share) their pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Splits the CPU threads between workers instead of oversubscribing."""
+    import torch  # pylint: disable=import-outside-toplevel
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))
@@ -5,13 +5,21 @@ AI-assisted responses, and QCM using generative AI.
 
 import random
 import logging
-from typing import List
+from typing import List, Sequence, Union
 
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 
-from config import API_KEY
+from config import (
+    API_KEY, LLM_MODE, LLM_CASSETTE_PATH, LLM_REPLAY_LATENCY, LLM_REPLAY_JITTER,
+    LLM_FAKE_ERROR_RATE, LLM_TIMEOUT, LLM_RATE_LIMIT, LLM_BURST,
+    LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX, LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET)
+from llm import LLMClient
+from gateway import CircuitBreaker, LLMGateway
+from telemetry import timed
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -20,26 +28,80 @@ logging.basicConfig(level=logging.INFO)
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 embedding_model = SentenceTransformer(MODEL_NAME)
 
-# Initialisation du modèle d'IA générative
-ai_model = ChatGoogleGenerativeAI(
-    model="gemini-1.5-pro",
-    temperature=0.5,
-    google_api_key=API_KEY
+# Initialisation du modèle d'IA générative (réel, enregistré, rejoué ou factice)
+# derrière la passerelle qui gère débit, concurrence, réessais et disjoncteur.
+# Les réessais du client Gemini sont désactivés : la passerelle s'en charge.
+# Seuls les modes qui appellent le fournisseur sont soumis à la limite de débit.
+LLM_MODEL_NAME = "gemini-1.5-pro"
+ai_model = LLMGateway(
+    LLMClient(
+        lambda: ChatGoogleGenerativeAI(
+            model=LLM_MODEL_NAME,
+            temperature=0.5,
+            google_api_key=API_KEY,
+            timeout=LLM_TIMEOUT,
+            max_retries=0
+        ),
+        model_name=LLM_MODEL_NAME,
+        mode=LLM_MODE,
+        cassette_path=LLM_CASSETTE_PATH,
+        latency=LLM_REPLAY_LATENCY,
+        jitter=LLM_REPLAY_JITTER,
+        error_rate=LLM_FAKE_ERROR_RATE,
+    ),
+    rate=LLM_RATE_LIMIT if LLM_MODE in ("live", "record") else None,
+    burst=LLM_BURST,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    queue_timeout=LLM_QUEUE_TIMEOUT,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_max=LLM_BACKOFF_MAX,
+    breaker=CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET),
 )
 
 
+@timed("embedding")
 def compute_embedding(text: str) -> List[float]:
     """Génère un vecteur d'embedding pour un texte donné."""
     return embedding_model.encode(text, normalize_embeddings=True).tolist()
 
 
-def generate_ai_response(question: str, context: str, language: str) -> str:
+@timed("embedding")
+def compute_embeddings(texts: Sequence[str]) -> np.ndarray:
+    """Génère les vecteurs d'embedding d'un lot de textes en un seul appel à l'encodeur."""
+    return embedding_model.encode(
+        list(texts),
+        normalize_embeddings=True,
+        convert_to_numpy=True)
+
+
+def build_context(documents: List[dict]) -> str:
+    """
+    Assemble plusieurs documents récupérés en un contexte numéroté.
+
+    Args:
+        documents (List[dict]): Documents issus de ``find_top_matches``.
+
+    Returns:
+        str: Le contexte multi-documents, chaque extrait suivi de sa source.
+    """
+    return "\n\n".join(
+        f"[{i}] {doc['answer']}\n(Source: {doc.get('source', 'Unknown')})"
+        for i, doc in enumerate(documents, start=1)
+    )
+
+
+def generate_ai_response(
+        question: str,
+        context: Union[str, List[dict]],
+        language: str) -> str:
     """
     Génère une réponse enrichie en utilisant un modèle d'IA.
 
     Args:
         question (str): La question posée.
-        context (str): Le contexte fourni.
+        context (Union[str, List[dict]]): Le contexte fourni, ou une liste
+            de documents récupérés.
         language (str): La langue de réponse.
 
     Returns:
@@ -58,11 +120,14 @@ def generate_ai_response(question: str, context: str, language: str) -> str:
        Language: {language}
         """
     )
-    response = (prompt | ai_model).invoke({
+    if not isinstance(context, str):
+        context = build_context(context)
+
+    response = ai_model.invoke(prompt.invoke({
         "question": question,
         "context": context,
         "language": language,
-    })
+    }))
     return response.content
 
 
@@ -0,0 +1,38 @@
+"""
+Cache LRU borné et partagé entre threads.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from telemetry import record_cache
+
+
+class LRUCache:
+    """Cache des ``maxsize`` entrées les plus récemment utilisées."""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retourne la valeur en cache, ou None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        record_cache(self.name, value is not None)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Ajoute ou remplace une entrée, en évinçant la plus ancienne si besoin."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
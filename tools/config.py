@@ -15,3 +15,45 @@ REGION = os.getenv("REGION")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 API_KEY = os.getenv("GOOGLE_API_KEY")
 TABLE_NAME = os.getenv("TABLE_NAME")
+
+# Client LLM : live | record | replay | fake
+LLM_MODE = os.getenv("LLM_MODE", "live")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "eval/llm_cassette.jsonl")
+LLM_REPLAY_LATENCY = float(os.getenv("LLM_REPLAY_LATENCY", "0"))
+LLM_REPLAY_JITTER = float(os.getenv("LLM_REPLAY_JITTER", "0"))
+
+# Export Prometheus sur /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Profilage à la demande (en-tête X-Profile-Token ou paramètre ?profile=)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+# Passerelle LLM : débit, concurrence, réessais et disjoncteur
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+
+# Budget de latence de /answer (secondes, 0 = attendre le LLM sans limite)
+ANSWER_BUDGET_SECONDS = float(os.getenv("ANSWER_BUDGET_SECONDS", "0"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+
+# Corpus partagé entre workers : matrice d'embeddings projetée en mémoire (mmap)
+CORPUS_MMAP_DIR = os.getenv("CORPUS_MMAP_DIR", "")
+
+# Recherche répartie sur plusieurs processus shards (0 ou 1 = désactivée)
+RETRIEVAL_SHARDS = int(os.getenv("RETRIEVAL_SHARDS", "0"))
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "1.0"))
+
+# Feedbacks utilisateurs (SQLite en écriture seule, compteurs par score)
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", "eval/feedback.db")
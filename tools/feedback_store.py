@@ -0,0 +1,169 @@
+"""
+Stockage des feedbacks utilisateurs dans SQLite.
+
+Les feedbacks sont ajoutés à une table en écriture seule (jamais modifiée
+ni supprimée). Chaque insertion met à jour, dans la même transaction, un
+compteur par score : les agrégats (répartition, total, moyenne) se lisent
+donc en temps constant, quel que soit le nombre de feedbacks enregistrés.
+
+Migration de l'ancien fichier CSV :
+    python tools/feedback_store.py import eval/feedback.csv
+"""
+
+import os
+import csv
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional
+
+from config import FEEDBACK_DB_PATH
+
+MIN_SCORE, MAX_SCORE = 1, 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    score INTEGER NOT NULL CHECK (score BETWEEN 1 AND 5),
+    comment TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feedback_counts (
+    score INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feedback_imports (
+    source TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    imported_at TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS feedback_append_only_update
+BEFORE UPDATE ON feedback
+BEGIN SELECT RAISE(ABORT, 'feedback is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS feedback_append_only_delete
+BEFORE DELETE ON feedback
+BEGIN SELECT RAISE(ABORT, 'feedback is append-only'); END;
+"""
+
+
+class FeedbackAggregates(NamedTuple):
+    """Répartition des scores, nombre total et moyenne des feedbacks."""
+    counts: Dict[int, int]
+    total: int
+    mean: Optional[float]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class FeedbackStore:
+    """Table de feedbacks en écriture seule avec compteurs par score."""
+
+    def __init__(self, path: str = FEEDBACK_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            # WAL : les lectures ne bloquent pas pendant une écriture
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connexion courte ; chaque appel a la sienne (threads et processus)."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction d'écriture : le verrou est pris dès le début."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _insert(conn, score: int, comment: str, created_at: str):
+        if not MIN_SCORE <= score <= MAX_SCORE:
+            raise ValueError(
+                f"Score must be between {MIN_SCORE} and {MAX_SCORE}, got {score}.")
+        conn.execute(
+            "INSERT INTO feedback (score, comment, created_at) VALUES (?, ?, ?)",
+            (score, comment or "", created_at))
+        conn.execute(
+            "INSERT INTO feedback_counts (score, count) VALUES (?, 1) "
+            "ON CONFLICT(score) DO UPDATE SET count = count + 1",
+            (score,))
+
+    def add(self, score: int, comment: str = ""):
+        """Enregistre un feedback et met à jour son compteur, atomiquement."""
+        with self._transaction() as conn:
+            self._insert(conn, int(score), comment, _now())
+
+    def aggregates(self) -> FeedbackAggregates:
+        """Répartition, total et moyenne, lus depuis les compteurs (O(1))."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT score, count FROM feedback_counts "
+                "WHERE count > 0 ORDER BY score").fetchall()
+        counts = dict(rows)
+        total = sum(counts.values())
+        mean = (sum(score * count for score, count in counts.items()) / total
+                if total else None)
+        return FeedbackAggregates(counts, total, mean)
+
+    def import_csv(self, csv_path: str) -> int:
+        """
+        Importe un fichier CSV (colonnes score, comment) en une transaction.
+
+        L'import est enregistré : un fichier déjà importé est ignoré.
+        Retourne le nombre de feedbacks ajoutés.
+        """
+        source = os.path.abspath(csv_path)
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            rows = [(int(row["score"]), row.get("comment") or "")
+                    for row in csv.DictReader(f) if row.get("score")]
+
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM feedback_imports WHERE source = ?",
+                            (source,)).fetchone():
+                return 0
+            created_at = _now()
+            for score, comment in rows:
+                self._insert(conn, score, comment, created_at)
+            conn.execute(
+                "INSERT INTO feedback_imports (source, rows, imported_at) "
+                "VALUES (?, ?, ?)", (source, len(rows), created_at))
+        return len(rows)
+
+
+def main():
+    """Point d'entrée en ligne de commande."""
+    parser = argparse.ArgumentParser(description="Feedback store maintenance.")
+    parser.add_argument("--db", default=FEEDBACK_DB_PATH, help="SQLite database path.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Import a feedback CSV file.")
+    import_parser.add_argument("csv_path")
+    commands.add_parser("stats", help="Print the feedback aggregates.")
+    args = parser.parse_args()
+
+    store = FeedbackStore(args.db)
+    if args.command == "import":
+        print(f"{store.import_csv(args.csv_path)} feedback rows imported.")
+    else:
+        aggregates = store.aggregates()
+        print(f"{aggregates.total} feedbacks, mean {aggregates.mean}, "
+              f"counts {aggregates.counts}")
+
+
+if __name__ == "__main__":
+    main()
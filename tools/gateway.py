@@ -0,0 +1,222 @@
+"""
+Passerelle d'accès au LLM : limite de débit, concurrence bornée,
+réessais avec backoff et disjoncteur.
+
+- un seau à jetons limite le nombre d'appels par seconde envoyés au fournisseur ;
+- un sémaphore borne les appels simultanés, l'attente étant elle-même bornée ;
+- les erreurs transitoires (quota, indisponibilité, délai dépassé) sont
+  réessayées avec un backoff exponentiel à gigue complète ;
+- après trop d'échecs consécutifs, le disjoncteur s'ouvre et les appels
+  échouent immédiatement jusqu'à ce qu'un appel d'essai réussisse.
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Optional
+
+from telemetry import (
+    in_flight, record_llm_rejection, record_llm_retry, set_circuit_state)
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    PROVIDER_RETRYABLE_ERRORS = (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
+except ImportError:  # Dépendance optionnelle
+    PROVIDER_RETRYABLE_ERRORS = ()
+
+RETRYABLE_ERRORS = (TimeoutError, ConnectionError) + PROVIDER_RETRYABLE_ERRORS
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(RuntimeError):
+    """Le LLM ne peut pas être appelé pour le moment."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Le disjoncteur est ouvert : le fournisseur est considéré dégradé."""
+
+
+class GatewayRejectedError(LLMUnavailableError):
+    """L'appel a attendu trop longtemps un créneau de débit ou de concurrence."""
+
+
+class RetriesExhaustedError(LLMUnavailableError):
+    """Le fournisseur a renvoyé une erreur transitoire à chaque tentative."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Indique si une erreur du fournisseur est transitoire."""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Seau à jetons : ``rate`` jetons par seconde, au plus ``capacity`` en réserve."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """Prend un jeton, en attendant au plus ``timeout`` secondes."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        self.state = state
+        set_circuit_state(state)
+
+    def allow(self) -> bool:
+        """Indique si un appel peut passer ; un seul appel d'essai en semi-ouvert."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """Un appel a réussi : le disjoncteur se referme."""
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        """Un appel a échoué après réessais."""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if (self.state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    logging.warning("LLM circuit breaker opened.")
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """L'appel s'est terminé sans verdict sur la santé du fournisseur."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class LLMGateway:
+    """Enveloppe d'un client LLM appliquant débit, concurrence, réessais et disjoncteur.
+
+    ``rate=None`` désactive la limite de débit (client rejoué ou factice)."""
+
+    def __init__(
+            self,
+            client,
+            rate: Optional[float],
+            burst: int,
+            max_concurrency: int,
+            queue_timeout: float,
+            max_retries: int,
+            backoff_base: float,
+            backoff_max: float,
+            breaker: CircuitBreaker):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+
+    def _backoff(self, attempt: int) -> float:
+        """Délai avant le réessai ``attempt`` (gigue complète)."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def invoke(self, prompt):
+        """Envoie un prompt au LLM à travers la passerelle."""
+        if not self.breaker.allow():
+            record_llm_rejection("circuit_open")
+            raise CircuitOpenError("LLM provider is degraded, failing fast.")
+
+        with in_flight("llm_queue"):
+            acquired = self.semaphore.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            self.breaker.release()
+            record_llm_rejection("concurrency")
+            raise GatewayRejectedError("Timed out waiting for an LLM slot.")
+
+        try:
+            return self._invoke_with_retries(prompt)
+        finally:
+            self.semaphore.release()
+
+    def _invoke_with_retries(self, prompt):
+        attempt = 0
+        while True:
+            if self.bucket is not None and not self.bucket.acquire(self.queue_timeout):
+                self.breaker.release()
+                record_llm_rejection("rate_limit")
+                raise GatewayRejectedError("Timed out waiting for the LLM rate limit.")
+            try:
+                response = self.client.invoke(prompt)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if not is_retryable(e):
+                    self.breaker.release()
+                    raise
+                if attempt == self.max_retries:
+                    self.breaker.record_failure()
+                    raise RetriesExhaustedError(
+                        f"LLM call failed after {attempt + 1} attempts "
+                        f"({type(e).__name__}).") from e
+                delay = self._backoff(attempt)
+                attempt += 1
+                record_llm_retry()
+                logging.warning(
+                    "Retryable LLM error (%s), retry %d in %.2fs",
+                    type(e).__name__, attempt, delay)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return response
@@ -0,0 +1,172 @@
+"""
+Client LLM enfichable autour de Gemini.
+
+Quatre modes, choisis par ``LLM_MODE`` :
+- ``live``   : appel direct du modèle ;
+- ``record`` : appel direct, et enregistrement des paires prompt → réponse
+  dans une cassette JSONL locale ;
+- ``replay`` : rejeu déterministe depuis la cassette, sans réseau,
+  avec une latence simulée configurable ;
+- ``fake``   : réponses synthétiques déterministes, sans cassette ni réseau,
+  avec un taux d'erreurs transitoires simulées configurable.
+"""
+
+import json
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from langchain_core.messages import AIMessage
+
+from telemetry import in_flight, record_cache, stage
+
+
+def prompt_to_text(prompt) -> str:
+    """Convertit un prompt (texte, PromptValue ou liste de messages) en texte."""
+    if isinstance(prompt, str):
+        return prompt
+    if hasattr(prompt, "to_string"):
+        return prompt.to_string()
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(getattr(message, "content", str(message))
+                         for message in prompt)
+    return str(prompt)
+
+
+def prompt_key(model_name: str, prompt_text: str) -> str:
+    """Clé stable d'un prompt pour un modèle donné."""
+    return hashlib.sha256(
+        f"{model_name}\n{prompt_text}".encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Stockage append-only des paires prompt → réponse au format JSONL."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._entries[entry["key"]] = entry["completion"]
+
+    def get(self, key: str) -> Optional[str]:
+        """Retourne la réponse enregistrée pour une clé, ou None."""
+        return self._entries.get(key)
+
+    def record(self, key: str, prompt_text: str, completion: str):
+        """Enregistre une paire prompt → réponse."""
+        with self._lock:
+            if self._entries.get(key) == completion:
+                return
+            self._entries[key] = completion
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "key": key,
+                    "prompt": prompt_text,
+                    "completion": completion,
+                }, ensure_ascii=False) + "\n")
+
+
+class FakeLLMError(ConnectionError):
+    """Erreur transitoire simulée par le mode ``fake``."""
+
+
+def fake_completion(prompt_text: str) -> str:
+    """Réponse synthétique déterministe pour un prompt."""
+    digest = hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()[:8]
+    if "separated by '###'" in prompt_text:
+        return " ### ".join(
+            f"Fake incorrect answer {i} ({digest})." for i in range(1, 4))
+    return f"Fake completion ({digest})."
+
+
+class LLMClient:
+    """Enveloppe d'un modèle de chat exposant ``invoke`` selon le mode choisi."""
+
+    MODES = ("live", "record", "replay", "fake")
+
+    def __init__(
+            self,
+            model_factory: Callable,
+            model_name: str,
+            mode: str = "live",
+            cassette_path: Optional[str] = None,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0):
+        if mode not in self.MODES:
+            raise ValueError(
+                f"Unknown LLM mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._model_factory = model_factory
+        self._model = None
+        self.cassette = (
+            Cassette(cassette_path)
+            if mode in ("record", "replay") and cassette_path else None)
+
+    @property
+    def model(self):
+        """Modèle réel, instancié au premier appel (inutile en replay/fake)."""
+        if self._model is None:
+            self._model = self._model_factory()
+        return self._model
+
+    def _simulate_latency(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def invoke(self, prompt):
+        """Envoie un prompt au modèle et retourne un message de réponse."""
+        with stage("llm"), in_flight("llm"):
+            return self._invoke(prompt)
+
+    def _invoke(self, prompt):
+        if self.mode == "live":
+            return self.model.invoke(prompt)
+
+        prompt_text = prompt_to_text(prompt)
+
+        if self.mode == "fake":
+            self._simulate_latency()
+            if random.random() < self.error_rate:
+                raise FakeLLMError("Simulated transient LLM failure.")
+            return AIMessage(content=fake_completion(prompt_text))
+
+        key = prompt_key(self.model_name, prompt_text)
+
+        if self.mode == "replay":
+            completion = self.cassette.get(key) if self.cassette else None
+            record_cache("llm_cassette", completion is not None)
+            if completion is None:
+                raise LookupError(
+                    f"No recorded completion for prompt {key[:12]} "
+                    f"in cassette {getattr(self.cassette, 'path', None)}")
+            self._simulate_latency()
+            return AIMessage(content=completion)
+
+        # Mode record
+        response = self.model.invoke(prompt)
+        content = getattr(response, "content", response)
+        if isinstance(content, str) and self.cassette:
+            self.cassette.record(key, prompt_text, content)
+        else:
+            logging.warning("LLM response for %s was not recorded.", key[:12])
+        return response
@@ -0,0 +1,159 @@
+"""
+Profilage à la demande d'une requête.
+
+Une requête est profilée lorsqu'elle porte le jeton ``PROFILE_TOKEN``
+(en-tête ``X-Profile-Token`` ou paramètre ``?profile=``), ou lorsqu'elle est
+tirée au sort avec la probabilité ``PROFILE_SAMPLE_RATE``.
+
+Le profil est enregistré dans ``PROFILE_DIR`` sous l'identifiant de la
+requête : flame graph HTML avec le profileur échantillonnant ``pyinstrument``
+s'il est installé, sinon statistiques ``pstats`` de ``cProfile``.
+
+``cProfile`` trace chaque appel et n'accepte qu'un profileur actif à la fois :
+sans ``pyinstrument``, le tirage au sort est désactivé et une requête
+authentifiée n'est profilée que si aucune autre ne l'est déjà.
+"""
+
+import os
+import re
+import hmac
+import uuid
+import random
+import cProfile
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+from config import PROFILE_TOKEN, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_KEEP
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # Dépendance optionnelle
+    Profiler = None
+
+if Profiler is None and PROFILE_SAMPLE_RATE > 0:
+    logging.warning(
+        "pyinstrument is not installed: PROFILE_SAMPLE_RATE is ignored, "
+        "cProfile is too costly for sampled traffic.")
+
+PROFILE_EXTENSIONS = (".html", ".pstats")
+
+# Un seul profil cProfile à la fois
+_cprofile_lock = threading.Lock()
+REQUEST_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Identifiant de profil de la requête en cours (None si non profilée)
+_profile_id: contextvars.ContextVar[Optional[str]] = \
+    contextvars.ContextVar("profile_id", default=None)
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Vérifie le jeton de profilage."""
+    return bool(PROFILE_TOKEN and token
+                and hmac.compare_digest(token, PROFILE_TOKEN))
+
+
+def should_profile(token: Optional[str]) -> bool:
+    """Décide si la requête en cours doit être profilée."""
+    if is_authorized(token):
+        return True
+    return (Profiler is not None and PROFILE_SAMPLE_RATE > 0
+            and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def start_profile() -> str:
+    """Marque la requête en cours comme profilée et retourne son identifiant."""
+    request_id = uuid.uuid4().hex
+    _profile_id.set(request_id)
+    return request_id
+
+
+def _mtime(path: str) -> Optional[float]:
+    """Date de modification, ou None si le fichier a déjà été supprimé."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def prune_profiles():
+    """Ne conserve que les ``PROFILE_KEEP`` profils les plus récents."""
+    # Un élagage concurrent peut supprimer des fichiers entre listdir et getmtime
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        mtime = _mtime(path) if name.endswith(PROFILE_EXTENSIONS) else None
+        if mtime is not None:
+            profiles.append((mtime, path))
+    profiles.sort(reverse=True)
+    for _, path in profiles[PROFILE_KEEP:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile_to(request_id: str):
+    """Profile le bloc et enregistre le résultat sous l'identifiant donné."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, request_id)
+
+    if Profiler is not None:
+        profiler = Profiler(interval=0.001)
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path + ".html", "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    elif not _cprofile_lock.acquire(blocking=False):
+        # Un autre profil est en cours : la requête n'est pas profilée
+        logging.info("Profile %s skipped, another cProfile run is active.",
+                     request_id)
+        yield
+        return
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(path + ".pstats")
+        finally:
+            _cprofile_lock.release()
+
+    logging.info("Profile %s written to %s", request_id, PROFILE_DIR)
+    prune_profiles()
+
+
+def profiled(func):
+    """Décorateur d'endpoint : profile l'appel si la requête a été sélectionnée.
+
+    Le profileur doit tourner dans le thread qui exécute l'endpoint, d'où un
+    décorateur plutôt qu'un profilage dans le middleware."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request_id = _profile_id.get()
+        if request_id is None:
+            return func(*args, **kwargs)
+        with profile_to(request_id):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def get_profile_path(request_id: str) -> Optional[str]:
+    """Retourne le chemin du profil d'une requête, s'il existe."""
+    if not REQUEST_ID_PATTERN.match(request_id):
+        return None
+    for extension in PROFILE_EXTENSIONS:
+        path = os.path.join(PROFILE_DIR, request_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
@@ -1,51 +1,332 @@
 """
-Module de recherche du meilleur texte correspondant à une requête
+Module de recherche des meilleurs textes correspondant à une requête
 en utilisant des métriques de similarité (cosinus, Jaccard, METEOR, BERTScore).
+
+La recherche se fait en deux étapes :
+1. sélection des ``k`` meilleurs candidats par similarité cosinus
+   (un seul produit matrice-matrice sur le corpus pour un lot de requêtes) ;
+2. reranking vectorisé de ces ``k`` candidats uniquement, de sorte que
+   le coût du reranking reste borné par ``k`` quelle que soit la taille du corpus.
+
+Avec ``RETRIEVAL_SHARDS`` > 1, la première étape est répartie entre des
+processus shards locaux (voir ``shards.py``) ; le reranking reste local.
 """
 
-from typing import List, Optional  # Import standard en premier
+import os
+import pickle
+import threading
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence  # Import standard en premier
 
 import numpy as np  # Bibliothèque tierce
-from sklearn.metrics.pairwise import cosine_similarity
-from bert_score import score as bert_score
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+from bert_score import BERTScorer
 from nltk.translate.meteor_score import meteor_score
 
-from utils import jaccard_similarity  # Imports internes en dernier
+from config import (  # Imports internes en dernier
+    CORPUS_MMAP_DIR, RETRIEVAL_SHARDS, SHARD_TIMEOUT)
 from database import get_all_embeddings
+from shards import ShardedSearcher
+from telemetry import record_cache, timed
 
+SIMILARITY_THRESHOLD = 0.75
+TOP_K = 5
+MAX_TOP_K = 50  # Borne du coût du reranking, quelle que soit la demande du client
+
+# Poids des métriques dans le score de reranking
+RERANK_WEIGHTS = {
+    "cosine_similarity": 0.5,
+    "bert_score": 0.3,
+    "jaccard_similarity": 0.1,
+    "meteor_score": 0.1,
+}
+
+
+class CorpusIndex(NamedTuple):
+    """Corpus pré-calculé : embeddings normalisés et ensembles de tokens.
+
+    En mode réparti, ``matrix`` vaut None et ``searcher`` interroge les shards."""
+    answers: List[str]
+    sources: List[str]
+    focus_areas: List[str]
+    matrix: Optional[np.ndarray]
+    vectorizer: CountVectorizer
+    token_matrix: csr_matrix
+    searcher: Optional[ShardedSearcher] = None
+
+
+def build_corpus_index_from_arrays(
+        answers: List[str],
+        sources: List[str],
+        focus_areas: List[str],
+        embeddings) -> CorpusIndex:
+    """Construit l'index du corpus à partir de colonnes déjà séparées."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    if not np.allclose(norms, 1.0, atol=1e-3):
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+    # Ensembles de tokens sous forme de matrice binaire creuse (un document par ligne)
+    vectorizer = CountVectorizer(
+        tokenizer=str.split,
+        token_pattern=None,
+        lowercase=False,
+        binary=True)
+    token_matrix = vectorizer.fit_transform(answers).tocsr()
+
+    return CorpusIndex(
+        answers=list(answers),
+        sources=list(sources),
+        focus_areas=list(focus_areas),
+        matrix=matrix,
+        vectorizer=vectorizer,
+        token_matrix=token_matrix,
+    )
 
-def find_best_match(
-        query_text: str,
-        query_embedding: List[float]) -> Optional[dict]:
-    """Trouve la meilleure correspondance pour une requête donnée
-      en utilisant plusieurs métriques de similarité."""
 
-    rows = get_all_embeddings()
+def build_corpus_index(rows: Sequence[tuple]) -> Optional[CorpusIndex]:
+    """Construit l'index du corpus à partir des lignes (answer, source, focus_area, embedding)."""
     if not rows:
         return None
 
-    docs = [row[3] for row in rows]
-    cosine_scores = cosine_similarity([query_embedding], docs)[0]
-    best_idx = np.argmax(cosine_scores)
+    return build_corpus_index_from_arrays(
+        [row[0] for row in rows],
+        [row[1] for row in rows],
+        [row[2] for row in rows],
+        [row[3] for row in rows],
+    )
 
-    if cosine_scores[best_idx] < 0.75:
+
+# Index fourni en mémoire (benchmarks, corpus synthétiques) à la place de la base
+_corpus_override: Optional[CorpusIndex] = None
+
+# Un seul chargement du corpus à la fois : lru_cache ne sérialise pas les
+# échecs concurrents, qui lanceraient chacun leurs propres processus shards
+_corpus_lock = threading.Lock()
+
+
+def use_corpus_index(index: Optional[CorpusIndex]):
+    """Remplace le corpus de la base par un index en mémoire (None pour revenir à la base)."""
+    global _corpus_override  # pylint: disable=global-statement
+    _corpus_override = index
+
+
+def get_corpus_index() -> Optional[CorpusIndex]:
+    """Retourne l'index du corpus en mémoire, ou celui chargé depuis la base."""
+    if _corpus_override is not None:
+        return _corpus_override
+    if load_corpus_index.cache_info().currsize > 0:
+        record_cache("corpus", True)
+        return load_corpus_index()
+    record_cache("corpus", False)
+    with _corpus_lock:
+        return load_corpus_index()
+
+
+def save_corpus_index(index: CorpusIndex, directory: str):
+    """Écrit l'index sur disque : matrice en .npy, le reste en pickle."""
+    os.makedirs(directory, exist_ok=True)
+    matrix_path = os.path.join(directory, "embeddings.npy")
+    metadata_path = os.path.join(directory, "metadata.pkl")
+
+    # Écriture atomique : plusieurs workers peuvent construire l'index en même temps
+    suffix = f".{os.getpid()}.tmp"
+    with open(matrix_path + suffix, "wb") as f:
+        np.save(f, np.ascontiguousarray(index.matrix, dtype=np.float32))
+    with open(metadata_path + suffix, "wb") as f:
+        pickle.dump(index._replace(matrix=None), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(matrix_path + suffix, matrix_path)
+    os.replace(metadata_path + suffix, metadata_path)
+
+
+def load_mapped_corpus_index(directory: str) -> Optional[CorpusIndex]:
+    """Charge l'index écrit par ``save_corpus_index``, matrice projetée en mémoire.
+
+    La matrice n'est pas copiée dans le tas du processus : toutes les pages
+    sont partagées, via le cache de pages du noyau, entre les workers."""
+    matrix_path = os.path.join(directory, "embeddings.npy")
+    metadata_path = os.path.join(directory, "metadata.pkl")
+    if not (os.path.exists(matrix_path) and os.path.exists(metadata_path)):
         return None
 
-    best_answer = rows[best_idx][0]
+    with open(metadata_path, "rb") as f:
+        index = pickle.load(f)
+    return index._replace(matrix=np.load(matrix_path, mmap_mode="r"))
+
+
+def shard_corpus_index(
+        index: CorpusIndex,
+        n_shards: int,
+        timeout: float = SHARD_TIMEOUT,
+        matrix_path: Optional[str] = None) -> CorpusIndex:
+    """Répartit la matrice du corpus entre ``n_shards`` processus ; le coordinateur
+    ne garde que les textes et les tokens nécessaires au reranking."""
+    searcher = ShardedSearcher(index.matrix, n_shards, timeout, matrix_path)
+    return index._replace(matrix=None, searcher=searcher)
+
 
-    # Calcul des métriques supplémentaires
-    jaccard_score = jaccard_similarity(query_text, best_answer)
-    meteor = meteor_score([best_answer.split()], query_text.split())
+def fetch_corpus_index() -> Optional[CorpusIndex]:
+    """Construit l'index depuis la base sans garder les lignes brutes en cache.
 
-    # Correction de l'affectation de BERTScore
-    _, _, f1_score = bert_score([query_text], [best_answer], lang="en")
+    Les embeddings en listes Python ne sont plus utiles une fois la matrice
+    construite ; en mode réparti, seuls les shards doivent tenir le corpus."""
+    index = build_corpus_index(get_all_embeddings())
+    get_all_embeddings.cache_clear()
+    return index
 
-    return {
-        "answer": best_answer,
-        "source": rows[best_idx][1],
-        "focus_area": rows[best_idx][2],
-        "cosine_similarity": round(cosine_scores[best_idx], 4),
-        "jaccard_similarity": round(jaccard_score, 4),
-        "meteor_score": round(meteor, 4),
-        "bert_score": round(f1_score.mean().item(), 4)
-    }
+
+@lru_cache(maxsize=1)
+@timed("corpus_load")
+def load_corpus_index() -> Optional[CorpusIndex]:
+    """Charge et met en cache l'index du corpus depuis la base,
+    ou depuis sa copie projetée en mémoire si ``CORPUS_MMAP_DIR`` est défini."""
+    matrix_path = None
+    if not CORPUS_MMAP_DIR:
+        index = fetch_corpus_index()
+    else:
+        index = load_mapped_corpus_index(CORPUS_MMAP_DIR)
+        if index is None:
+            index = fetch_corpus_index()
+            if index is None:
+                return None
+            save_corpus_index(index, CORPUS_MMAP_DIR)
+            index = load_mapped_corpus_index(CORPUS_MMAP_DIR)
+        matrix_path = os.path.join(CORPUS_MMAP_DIR, "embeddings.npy")
+
+    if index is not None and RETRIEVAL_SHARDS > 1:
+        index = shard_corpus_index(
+            index, RETRIEVAL_SHARDS, SHARD_TIMEOUT, matrix_path)
+    return index
+
+
+@lru_cache(maxsize=1)
+def get_bert_scorer() -> BERTScorer:
+    """Charge le modèle BERTScore une seule fois par processus."""
+    return BERTScorer(lang="en")
+
+
+@timed("retrieval")
+def top_k_candidates(
+        index: CorpusIndex,
+        query_embeddings: Sequence[Sequence[float]],
+        k: int = TOP_K,
+        threshold: float = SIMILARITY_THRESHOLD) -> List[List[tuple]]:
+    """Retourne, pour chaque requête, les ``k`` meilleurs couples (indice, cosinus)
+    au-dessus du seuil, en un seul produit matrice-matrice."""
+    k = max(1, min(k, MAX_TOP_K))
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.where(norms == 0, 1.0, norms)
+
+    if index.searcher is not None:
+        return index.searcher.search(queries, k, threshold)
+
+    scores = queries @ index.matrix.T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    return [
+        [(int(i), float(score))
+         for i, score in zip(row, row_scores) if score >= threshold]
+        for row, row_scores in zip(top, top_scores)
+    ]
+
+
+@timed("rerank")
+def rerank_candidates(
+        index: CorpusIndex,
+        query_texts: Sequence[str],
+        candidates: Sequence[List[tuple]]) -> List[List[dict]]:
+    """Calcule les métriques secondaires en lot sur les candidats de chaque requête
+    et les réordonne."""
+    pairs = [(q, i, score)
+             for q, cands in enumerate(candidates)
+             for i, score in cands]
+    if not pairs:
+        return [[] for _ in query_texts]
+
+    owners = np.array([q for q, _, _ in pairs])
+    indices = np.array([i for _, i, _ in pairs])
+    cosine_scores = np.array([score for _, _, score in pairs])
+    texts = [query_texts[q] for q in owners]
+    answers = [index.answers[i] for i in indices]
+
+    # Jaccard vectorisé : |A ∩ B| = produit des vecteurs binaires de tokens
+    query_tokens = [set(text.split()) for text in query_texts]
+    query_vectors = index.vectorizer.transform(
+        [" ".join(tokens) for tokens in query_tokens])[owners]
+    candidate_vectors = index.token_matrix[indices]
+    intersections = np.asarray(
+        candidate_vectors.multiply(query_vectors).sum(axis=1)).ravel()
+    unions = (np.asarray(candidate_vectors.sum(axis=1)).ravel()
+              + np.array([len(query_tokens[q]) for q in owners])
+              - intersections)
+    jaccard_scores = np.divide(
+        intersections, unions,
+        out=np.zeros_like(intersections, dtype=float),
+        where=unions > 0)
+
+    meteor_scores = np.array([
+        meteor_score([answer.split()], text.split())
+        for text, answer in zip(texts, answers)
+    ])
+
+    # BERTScore en un seul lot pour tous les candidats
+    _, _, f1_scores = get_bert_scorer().score(texts, answers)
+    bert_scores = f1_scores.numpy()
+
+    rerank_scores = (
+        RERANK_WEIGHTS["cosine_similarity"] * cosine_scores
+        + RERANK_WEIGHTS["bert_score"] * bert_scores
+        + RERANK_WEIGHTS["jaccard_similarity"] * jaccard_scores
+        + RERANK_WEIGHTS["meteor_score"] * meteor_scores
+    )
+
+    results = [[] for _ in query_texts]
+    for j in np.argsort(-rerank_scores, kind="stable"):
+        results[owners[j]].append({
+            "answer": answers[j],
+            "source": index.sources[indices[j]],
+            "focus_area": index.focus_areas[indices[j]],
+            "cosine_similarity": round(float(cosine_scores[j]), 4),
+            "jaccard_similarity": round(float(jaccard_scores[j]), 4),
+            "meteor_score": round(float(meteor_scores[j]), 4),
+            "bert_score": round(float(bert_scores[j]), 4),
+            "rerank_score": round(float(rerank_scores[j]), 4),
+        })
+    return results
+
+
+def find_top_matches_batch(
+        query_texts: Sequence[str],
+        query_embeddings: Sequence[Sequence[float]],
+        k: int = TOP_K) -> List[List[dict]]:
+    """Trouve les ``k`` meilleures correspondances pour plusieurs requêtes à la fois."""
+    index = get_corpus_index()
+    if index is None or not query_texts:
+        return [[] for _ in query_texts]
+
+    candidates = top_k_candidates(index, query_embeddings, k)
+    return rerank_candidates(index, query_texts, candidates)
+
+
+def find_top_matches(
+        query_text: str,
+        query_embedding: List[float],
+        k: int = TOP_K) -> List[dict]:
+    """Trouve les ``k`` meilleures correspondances, réordonnées par métriques secondaires."""
+    return find_top_matches_batch([query_text], [query_embedding], k)[0]
+
+
+def find_best_match(
+        query_text: str,
+        query_embedding: List[float]) -> Optional[dict]:
+    """Trouve la meilleure correspondance pour une requête donnée
+      en utilisant plusieurs métriques de similarité."""
+    matches = find_top_matches(query_text, query_embedding)
+    return matches[0] if matches else None
@@ -0,0 +1,258 @@
+"""
+Recherche répartie (scatter-gather) sur plusieurs processus locaux.
+
+Le corpus est découpé en shards contigus ; chaque shard est tenu par un
+processus qui ne lit que sa tranche de la matrice d'embeddings (une vue
+projetée en mémoire en lecture seule lorsque la matrice est sur disque, donc
+partagée via le cache de pages entre workers et shards). Le coordinateur
+diffuse les vecteurs de requête à tous les shards, attend les réponses au
+plus ``timeout`` secondes, puis fusionne les top-k partiels et applique le
+seuil de similarité. Un shard en retard est ignoré pour la requête en cours :
+le résultat est partiel plutôt que bloqué. Un shard qui a encore une requête
+sans réponse ne reçoit rien de plus, et un shard arrêté est relancé en
+arrière-plan.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from telemetry import record_shard_restart, record_shard_timeout
+
+# Délai maximal de démarrage d'un processus shard, et intervalle minimal
+# entre deux relances d'un même shard
+STARTUP_TIMEOUT = 120.0
+RESTART_INTERVAL = 5.0
+
+
+def _load_shard(source) -> np.ndarray:
+    """Tranche de matrice du shard : tableau transmis ou (fichier .npy, début, fin).
+
+    Depuis un fichier, la tranche reste une vue projetée en lecture seule : elle
+    n'est pas copiée dans le tas du processus."""
+    if isinstance(source, tuple):
+        path, start, stop = source
+        return np.load(path, mmap_mode="r")[start:stop]
+    return source
+
+
+def _serve_shard(conn, offset: int, source):
+    """Boucle d'un processus shard : top-k local pour chaque lot de requêtes."""
+    matrix = _load_shard(source)
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, queries, k = message
+        scores = queries @ matrix.T
+        k = max(1, min(k, scores.shape[1]))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        conn.send((request_id, top + offset, np.take_along_axis(scores, top, axis=1)))
+
+
+class _Shard:
+    """Connexion du coordinateur vers un processus shard."""
+
+    def __init__(self, context, number: int, offset: int, source):
+        self.context = context
+        self.number = number
+        self.offset = offset
+        self.source = source
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        # Requête envoyée dont la réponse n'a pas encore été lue
+        self.pending: Optional[int] = None
+        self.restarting = False
+        self.started_at = 0.0
+        self._restart_lock = threading.Lock()
+
+    def start(self):
+        """Lance le processus shard (sans attendre qu'il soit prêt)."""
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_serve_shard, args=(child_conn, self.offset, self.source),
+            name=f"corpus-shard-{self.number}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.pending = None
+        self.started_at = time.monotonic()
+
+    def wait_ready(self):
+        """Attend le message "ready" du processus shard."""
+        if not self.conn.poll(STARTUP_TIMEOUT):
+            raise TimeoutError(f"Shard {self.number} did not start in time.")
+        self.conn.recv()
+
+    def _drain(self):
+        """Lit les réponses en attente ; indique si le shard est de nouveau libre."""
+        while self.pending is not None and self.conn.poll(0):
+            reply_id, _, _ = self.conn.recv()
+            if reply_id == self.pending:
+                self.pending = None
+        return self.pending is None
+
+    def ask(self, request_id: int, queries: np.ndarray, k: int,
+            timeout: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Envoie un lot de requêtes et attend la réponse au plus ``timeout`` secondes."""
+        if self.restarting:
+            return None
+        deadline = time.monotonic() + timeout
+        if not self.lock.acquire(timeout=timeout):
+            return None
+        try:
+            # Un shard encore occupé par une requête abandonnée est ignoré :
+            # les envois ne s'accumulent pas dans le tube
+            if not self._drain():
+                return None
+            self.conn.send((request_id, queries, k))
+            self.pending = request_id
+            while self.conn.poll(max(0.0, deadline - time.monotonic())):
+                reply_id, indices, scores = self.conn.recv()
+                if reply_id == request_id:
+                    self.pending = None
+                    return indices, scores
+            return None
+        except (EOFError, OSError):
+            logging.error("Shard %d is unreachable.", self.number)
+            return None
+        finally:
+            self.lock.release()
+
+    def is_alive(self) -> bool:
+        """Indique si le processus shard tourne."""
+        return self.process is not None and self.process.is_alive()
+
+    def restart_if_dead(self):
+        """Relance en arrière-plan un shard arrêté (au plus une fois par intervalle)."""
+        with self._restart_lock:
+            if (self.restarting or self.is_alive()
+                    or time.monotonic() - self.started_at < RESTART_INTERVAL):
+                return
+            self.restarting = True
+        logging.error("Shard %d died (exit code %s), restarting it.",
+                      self.number, self.process.exitcode)
+        record_shard_restart(self.number)
+        threading.Thread(target=self._restart, name=f"restart-shard-{self.number}",
+                         daemon=True).start()
+
+    def _restart(self):
+        try:
+            with self.lock:
+                self.conn.close()
+                self.process.join(timeout=1)
+                self.start()
+                self.wait_ready()
+        except (EOFError, OSError, TimeoutError) as e:
+            logging.error("Shard %d failed to restart: %s", self.number, e)
+            self.process.terminate()  # Nouvel essai à la prochaine requête manquée
+        finally:
+            self.restarting = False
+
+    def stop(self):
+        """Arrête le processus shard."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ShardedSearcher:
+    """Coordinateur de recherche répartie sur ``n_shards`` processus locaux."""
+
+    def __init__(self, matrix: np.ndarray, n_shards: int, timeout: float,
+                 matrix_path: Optional[str] = None):
+        self.size = matrix.shape[0]
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+
+        # Pas de shard vide : au plus un shard par document
+        n_shards = max(1, min(n_shards, self.size))
+        # spawn plutôt que fork : les shards n'héritent pas de l'état torch/BLAS
+        context = mp.get_context("spawn")
+        bounds = np.linspace(0, self.size, n_shards + 1, dtype=int)
+        self.shards: List[_Shard] = []
+        for number, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            source = ((matrix_path, int(start), int(stop)) if matrix_path
+                      else np.ascontiguousarray(matrix[start:stop]))
+            shard = _Shard(context, number, int(start), source)
+            shard.start()
+            self.shards.append(shard)
+
+        for shard in self.shards:
+            shard.wait_ready()
+        self._pool = ThreadPoolExecutor(
+            max_workers=4 * n_shards, thread_name_prefix="shard-scatter")
+        atexit.register(self.close)
+        logging.info("Corpus of %d documents split across %d shards.",
+                     self.size, n_shards)
+
+    def search(self, queries: np.ndarray, k: int,
+               threshold: float) -> List[List[Tuple[int, float]]]:
+        """Top-k global par requête, au-dessus du seuil, fusionné depuis les shards."""
+        if os.getpid() != self.pid:
+            raise RuntimeError(
+                "ShardedSearcher pipes cannot be shared across fork; "
+                "create the shards in each worker process.")
+        with self._id_lock:
+            self._next_id += 1
+            request_id = self._next_id
+
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        futures = [
+            self._pool.submit(shard.ask, request_id, queries, k, self.timeout)
+            for shard in self.shards
+        ]
+        # Le rassemblement lui-même est borné : un envoi bloqué dans un tube
+        # plein ne retient pas la requête au-delà du délai
+        wait(futures, timeout=self.timeout)
+
+        replies = []
+        for shard, future in zip(self.shards, futures):
+            reply = future.result() if future.done() else None
+            if reply is None:
+                logging.warning("Shard %d missed the %.2fs deadline.",
+                                shard.number, self.timeout)
+                record_shard_timeout(shard.number)
+                shard.restart_if_dead()
+            else:
+                replies.append(reply)
+
+        if not replies:
+            return [[] for _ in range(len(queries))]
+
+        indices = np.concatenate([reply[0] for reply in replies], axis=1)
+        scores = np.concatenate([reply[1] for reply in replies], axis=1)
+        k = max(1, min(k, scores.shape[1]))
+        top = np.argsort(-scores, axis=1)[:, :k]
+        top_indices = np.take_along_axis(indices, top, axis=1)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        return [
+            [(int(i), float(score))
+             for i, score in zip(row, row_scores) if score >= threshold]
+            for row, row_scores in zip(top_indices, top_scores)
+        ]
+
+    def close(self):
+        """Arrête les processus shards."""
+        for shard in self.shards:
+            shard.stop()
+        self.shards = []
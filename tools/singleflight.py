@@ -0,0 +1,56 @@
+"""
+Déduplication des calculs identiques en cours (« single flight »).
+
+Lorsque plusieurs requêtes demandent le même calcul en même temps, seule la
+première l'exécute ; les suivantes attendent son résultat (ou son exception)
+au lieu de le recalculer.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from telemetry import record_coalesced
+
+
+class _Call:
+    """Calcul en cours partagé entre les requêtes identiques."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Regroupe les appels concurrents portant la même clé."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        """Exécute ``func`` une seule fois pour tous les appels concurrents de même clé."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            record_coalesced(self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
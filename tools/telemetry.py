@@ -0,0 +1,186 @@
+"""
+Instrumentation par étape du pipeline (embedding, recherche, métriques,
+connexion à la base, appels LLM).
+
+Chaque étape est chronométrée une seule fois et publiée à deux endroits :
+- des histogrammes Prometheus exposés sur ``/metrics`` (si ``METRICS_ENABLED``
+  et ``prometheus_client`` est installé) ;
+- le dictionnaire de la requête en cours, renvoyé dans l'en-tête ``Server-Timing``.
+
+Sans Prometheus, le coût se limite à deux appels à ``perf_counter``.
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+from config import METRICS_ENABLED
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest)
+except ImportError:  # Dépendance optionnelle
+    Counter = Gauge = Histogram = generate_latest = None
+    CONTENT_TYPE_LATEST = "text/plain"
+
+PROMETHEUS_ENABLED = METRICS_ENABLED and Histogram is not None
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+if PROMETHEUS_ENABLED:
+    STAGE_SECONDS = Histogram(
+        "genai_stage_seconds", "Duration of each pipeline stage.",
+        ["stage"], buckets=LATENCY_BUCKETS)
+    REQUEST_SECONDS = Histogram(
+        "genai_request_seconds", "Duration of each HTTP request.",
+        ["endpoint", "status"], buckets=LATENCY_BUCKETS)
+    CACHE_REQUESTS = Counter(
+        "genai_cache_requests_total", "Cache lookups by outcome.",
+        ["cache", "result"])
+    IN_FLIGHT = Gauge(
+        "genai_in_flight", "Operations currently in progress.", ["kind"])
+    COALESCED_REQUESTS = Counter(
+        "genai_coalesced_requests_total",
+        "Requests served by an identical computation already in flight.",
+        ["operation"])
+    LLM_REJECTIONS = Counter(
+        "genai_llm_rejections_total",
+        "LLM calls rejected by the gateway.", ["reason"])
+    LLM_RETRIES = Counter(
+        "genai_llm_retries_total", "LLM calls retried after a transient error.")
+    LLM_CIRCUIT_STATE = Gauge(
+        "genai_llm_circuit_state",
+        "LLM circuit breaker state (0 closed, 1 half-open, 2 open).")
+    SHARD_TIMEOUTS = Counter(
+        "genai_shard_timeouts_total",
+        "Retrieval shards that missed their deadline.", ["shard"])
+    SHARD_RESTARTS = Counter(
+        "genai_shard_restarts_total",
+        "Retrieval shard processes restarted after dying.", ["shard"])
+else:
+    STAGE_SECONDS = REQUEST_SECONDS = CACHE_REQUESTS = IN_FLIGHT = None
+    COALESCED_REQUESTS = LLM_REJECTIONS = LLM_RETRIES = LLM_CIRCUIT_STATE = None
+    SHARD_TIMEOUTS = SHARD_RESTARTS = None
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Durées des étapes de la requête HTTP en cours
+_stage_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = \
+    contextvars.ContextVar("stage_timings", default=None)
+
+
+def start_request(timings: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Ouvre le relevé des étapes pour la requête en cours (ou dans ``timings``)."""
+    timings = {} if timings is None else timings
+    _stage_timings.set(timings)
+    return timings
+
+
+def merge_timings(timings: Dict[str, float]):
+    """Ajoute à la requête en cours des durées relevées dans un autre contexte."""
+    current = _stage_timings.get()
+    if current is not None:
+        for name, elapsed in timings.items():
+            current[name] = current.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def stage(name: str):
+    """Chronomètre une étape du pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        if STAGE_SECONDS is not None:
+            STAGE_SECONDS.labels(name).observe(elapsed)
+
+
+def timed(name: str):
+    """Décorateur : chronomètre chaque appel de la fonction comme une étape."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def in_flight(kind: str):
+    """Compte les opérations en cours d'un type donné."""
+    if IN_FLIGHT is None:
+        yield
+        return
+    gauge = IN_FLIGHT.labels(kind)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def record_cache(cache: str, hit: bool):
+    """Enregistre un accès à un cache (succès ou échec)."""
+    if CACHE_REQUESTS is not None:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_coalesced(operation: str):
+    """Enregistre une requête regroupée avec un calcul identique en cours."""
+    if COALESCED_REQUESTS is not None:
+        COALESCED_REQUESTS.labels(operation).inc()
+
+
+def record_llm_rejection(reason: str):
+    """Enregistre un appel LLM refusé par la passerelle."""
+    if LLM_REJECTIONS is not None:
+        LLM_REJECTIONS.labels(reason).inc()
+
+
+def record_llm_retry():
+    """Enregistre un réessai d'appel LLM."""
+    if LLM_RETRIES is not None:
+        LLM_RETRIES.inc()
+
+
+def set_circuit_state(state: str):
+    """Publie l'état du disjoncteur LLM."""
+    if LLM_CIRCUIT_STATE is not None:
+        LLM_CIRCUIT_STATE.set(CIRCUIT_STATES[state])
+
+
+def record_shard_timeout(shard: int):
+    """Enregistre un shard de recherche en retard."""
+    if SHARD_TIMEOUTS is not None:
+        SHARD_TIMEOUTS.labels(str(shard)).inc()
+
+
+def record_shard_restart(shard: int):
+    """Enregistre la relance d'un processus shard arrêté."""
+    if SHARD_RESTARTS is not None:
+        SHARD_RESTARTS.labels(str(shard)).inc()
+
+
+def record_request(endpoint: str, status: int, elapsed: float):
+    """Enregistre la durée totale d'une requête HTTP."""
+    if REQUEST_SECONDS is not None:
+        REQUEST_SECONDS.labels(endpoint, str(status)).observe(elapsed)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Formate les durées des étapes pour l'en-tête ``Server-Timing``."""
+    return ", ".join(
+        f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings.items())
+
+
+def metrics_payload():
+    """Retourne le corps et le type de contenu de l'export Prometheus."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -12,6 +12,7 @@ from nltk.translate.meteor_score import meteor_score  # Import déplacé ici
 from config import TABLE_NAME
 from database import connect_db
 from agents import compute_embedding
+from telemetry import timed
 
 
 def get_random_questions(n: int):
@@ -56,6 +57,7 @@ def jaccard_similarity(text1: str, text2: str) -> float:
     return len(set1 & set2) / len(set1 | set2) if set1 | set2 else 0.0
 
 
+@timed("metrics")
 def assess_response_metrics(
     query: str, reference_answer: str, generated_response: str
 ) -> Dict[str, float]: